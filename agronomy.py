@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from weather import Forecast
+import numpy as np
+import warnings
+
+
+HOURS_PER_DAY = 24
+
+
+def _hourly(forecast: Forecast, variable: str) -> np.ndarray:
+    # Zero-copy view over the cached column.
+    return np.frombuffer(forecast.series[variable], dtype=np.float64)[:forecast.hours]
+
+
+def _daily(values: np.ndarray) -> np.ndarray:
+    days = len(values) // HOURS_PER_DAY
+    return values[:days * HOURS_PER_DAY].reshape(days, HOURS_PER_DAY)
+
+
+def _as_list(values: np.ndarray) -> list:
+    return [None if np.isnan(value) else round(float(value), 3) for value in values]
+
+
+def _trailing_sum(values: np.ndarray, window: int) -> np.ndarray:
+    totals = np.cumsum(values)
+    totals[window:] -= totals[:-window].copy()
+    return totals
+
+
+def frost_windows(temperature: np.ndarray, threshold: float, start: datetime):
+    """Contiguous runs of hours at or below `threshold`, with their coldest temperature."""
+    frozen = temperature <= threshold
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], frozen, [False])).astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+    if not len(starts):
+        return []
+
+    # Hours outside a window are masked to +inf so each reduceat segment only sees its own run.
+    minima = np.minimum.reduceat(np.where(frozen, temperature, np.inf), starts)
+    return [
+        {
+            "start": (start + timedelta(hours=int(first))).isoformat(timespec="minutes"),
+            "end": (start + timedelta(hours=int(last))).isoformat(timespec="minutes"),
+            "hours": int(last - first),
+            "min_temperature": round(float(coldest), 3),
+        }
+        for first, last, coldest in zip(starts, ends, minima)
+    ]
+
+
+def compute_indicators(forecast: Forecast, base_temperature: float = 10.0,
+                       frost_threshold: float = 0.0, rolling_days: int = 3) -> dict:
+    """Daily agronomic indicators computed from a cached hourly forecast.
+
+    Growing degree days use the daily (max + min) / 2 method against `base_temperature`.
+    The water balance is precipitation minus evapotranspiration. Only whole days of data
+    are aggregated, and values come back as one list per indicator.
+    """
+    start = datetime.fromisoformat(forecast.start_time)
+    temperature = _hourly(forecast, "temperature_2m")
+    daily_temperature = _daily(temperature)
+
+    with warnings.catch_warnings():
+        # Days whose hours are all missing aggregate to NaN, reported as null.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        temperature_min = np.nanmin(daily_temperature, axis=1)
+        temperature_max = np.nanmax(daily_temperature, axis=1)
+        temperature_mean = np.nanmean(daily_temperature, axis=1)
+
+    growing_degree_days = np.clip((temperature_max + temperature_min) / 2 - base_temperature, 0, None)
+    precipitation = np.nansum(_daily(_hourly(forecast, "precipitation")), axis=1)
+    evapotranspiration = np.nansum(_daily(_hourly(forecast, "evapotranspiration")), axis=1)
+    water_balance = precipitation - evapotranspiration
+    frost_hours = np.sum(daily_temperature <= frost_threshold, axis=1)
+
+    return {
+        "latitude": forecast.latitude,
+        "longitude": forecast.longitude,
+        "base_temperature": base_temperature,
+        "frost_threshold": frost_threshold,
+        "daily": {
+            "date": [(start + timedelta(days=day)).date().isoformat() for day in range(len(daily_temperature))],
+            "temperature_min": _as_list(temperature_min),
+            "temperature_max": _as_list(temperature_max),
+            "temperature_mean": _as_list(temperature_mean),
+            "growing_degree_days": _as_list(growing_degree_days),
+            "cumulative_growing_degree_days": _as_list(np.nancumsum(growing_degree_days)),
+            "precipitation": _as_list(precipitation),
+            "cumulative_precipitation": _as_list(np.cumsum(precipitation)),
+            f"precipitation_{rolling_days}d": _as_list(_trailing_sum(precipitation, rolling_days)),
+            "evapotranspiration": _as_list(evapotranspiration),
+            "water_balance": _as_list(water_balance),
+            "cumulative_water_balance": _as_list(np.cumsum(water_balance)),
+            "frost_hours": frost_hours.tolist(),
+        },
+        "frost_windows": frost_windows(temperature, frost_threshold, start),
+    }
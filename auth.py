@@ -1,23 +1,103 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from database import get_db
-from models import User
+from database import get_db, end_read_transaction
+from models import User, RefreshToken
+from revocation import revocation_list
 from datetime import datetime, timedelta
 from typing import Optional
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import hashlib
+import secrets
+import uuid
+import time
 import os
 
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL, so hashing threads scale with cores without blocking the event loop.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+password_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending_hashes = 0
+
+LOGIN_RATE_LIMIT = int(os.getenv("LOGIN_RATE_LIMIT", "10"))
+LOGIN_RATE_WINDOW_SECONDS = float(os.getenv("LOGIN_RATE_WINDOW_SECONDS", "60"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+
+class CurrentUser:
+    """Detached snapshot of the authenticated user, safe to cache between requests."""
+
+    __slots__ = ("id", "username", "email", "full_name", "is_admin", "token_version", "token_salt")
+
+    def __init__(self, id, username, email, full_name, is_admin, token_version, token_salt):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.full_name = full_name
+        self.is_admin = bool(is_admin)
+        self.token_version = token_version or 0
+        self.token_salt = token_salt or ""
+
+    @classmethod
+    def from_user(cls, user: User) -> "CurrentUser":
+        return cls(user.id, user.username, user.email, user.full_name, user.is_admin, user.token_version,
+                   user.token_salt)
+
+
+class PrincipalCache:
+    """Bounded LRU of CurrentUser snapshots by user id, each kept for a short TTL."""
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_SIZE, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[CurrentUser]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, principal: CurrentUser):
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl_seconds, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+principal_cache = PrincipalCache()
+
 
 def hash_password(password: str) -> str:
     """Hashes a password using bcrypt."""
@@ -29,14 +109,79 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def get_user_by_username(db: Session, username: str):
+async def _run_password_work(fn, *args):
+    global _pending_hashes
+    if _pending_hashes >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent password operations, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    _pending_hashes += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_hash_pool, fn, *args)
+    finally:
+        _pending_hashes -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    """Hashes a password on the password worker pool."""
+    return await _run_password_work(pwd_context.hash, password)
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Verifies a password on the worker pool; returns (valid, new_hash) where new_hash is set
+    when the stored hash uses an outdated scheme or cost and should be replaced."""
+    return await _run_password_work(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+class RateLimiter:
+    """Sliding-window limit of `limit` attempts per `window_seconds` for each key."""
+
+    def __init__(self, limit: int, window_seconds: float, max_keys: int = 100_000):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._attempts = {}
+
+    def hit(self, key: str) -> float:
+        """Records an attempt; returns 0 if allowed, otherwise the seconds until the next one is."""
+        now = time.monotonic()
+        attempts = self._attempts.setdefault(key, deque())
+        while attempts and attempts[0] <= now - self.window_seconds:
+            attempts.popleft()
+        if len(attempts) >= self.limit:
+            return attempts[0] + self.window_seconds - now
+        attempts.append(now)
+
+        if len(self._attempts) > self.max_keys:
+            self._attempts = {k: v for k, v in self._attempts.items() if v and v[-1] > now - self.window_seconds}
+        return 0
+
+
+login_rate_limiter = RateLimiter(LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW_SECONDS)
+
+
+def check_login_rate(client_ip: str):
+    """Raises 429 when an IP has spent its password attempts for the current window."""
+    retry_after = login_rate_limiter.hit(client_ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
     """Retrieves a user by username."""
-    return db.query(User).filter(User.username == username).first()
+    return await db.scalar(select(User).where(User.username == username))
 
 
-def create_user(db: Session, username: str, email: str, full_name: str, password: str, is_admin: bool = False):
+async def create_user(db: AsyncSession, username: str, email: str, full_name: str, password: str, is_admin: bool = False):
     """Creates a new user and stores hashed password."""
-    hashed_password = hash_password(password)
+    await end_read_transaction(db)
+    hashed_password = await hash_password_async(password)
     db_user = User(
         username=username,
         email=email,
@@ -45,51 +190,186 @@ def create_user(db: Session, username: str, email: str, full_name: str, password
         is_admin=is_admin,
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    """Authenticates user credentials."""
-    user = get_user_by_username(db, username)
-    if not user or not verify_password(password, user.hashed_password):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    """Authenticates user credentials, rehashing the password if its bcrypt cost or scheme is outdated."""
+    user = await get_user_by_username(db, username)
+    if not user:
+        return None
+
+    await end_read_transaction(db)
+    valid, new_hash = await verify_and_update_password(password, user.hashed_password)
+    if not valid:
         return None
+
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
 
+def token_claims(user: User) -> dict:
+    """Claims that let requests be authorized without loading the user: id, token salt and token version.
+
+    The salt is random per account, so a token never matches a later account that reuses the id.
+    """
+    return {"sub": user.username, "uid": user.id, "slt": user.token_salt or "", "ver": user.token_version or 0}
+
+
+def invalidate_user(user_id: int):
+    """Drops a user's cached principal after their profile, password or account changes."""
+    principal_cache.invalidate(user_id)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Creates a JWT access token with expiration."""
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=15))
     to_encode.update({"exp": expire})
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    """Gets the currently authenticated user from the JWT token."""
+def _hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_refresh_token(db: AsyncSession, user: User, family_id: Optional[str] = None) -> str:
+    """Creates an opaque refresh token for a user; only its SHA-256 is stored."""
+    token = secrets.token_urlsafe(48)
+    db.add(RefreshToken(
+        token_hash=_hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        user_id=user.id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    await db.commit()
+    return token
+
+
+async def _revoke_family(db: AsyncSession, family_id: str, now: datetime):
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    await db.commit()
+
+
+async def rotate_refresh_token(db: AsyncSession, token: str):
+    """Exchanges a refresh token for a new one in the same family and returns (user, new_token).
+
+    Presenting a token that was already rotated means it leaked, so the whole family is revoked.
+    The token is revoked with a conditional UPDATE, so of two concurrent refreshes with the same
+    token only one gets a new token and the other counts as reuse.
+    """
+    invalid = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    now = datetime.utcnow()
+    token_hash = _hash_refresh_token(token)
+    record = await db.scalar(
+        select(RefreshToken)
+        .options(joinedload(RefreshToken.user))
+        .where(RefreshToken.token_hash == token_hash)
+    )
+
+    if record is None:
+        raise invalid
+    if record.revoked_at is not None:
+        await _revoke_family(db, record.family_id, now)
+        raise invalid
+    if record.expires_at <= now or record.user is None:
+        raise invalid
+
+    claimed = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == token_hash, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    if claimed.rowcount != 1:
+        await _revoke_family(db, record.family_id, now)
+        raise invalid
+    return record.user, await issue_refresh_token(db, record.user, record.family_id)
+
+
+async def revoke_refresh_token(db: AsyncSession, token: str):
+    """Revokes a single refresh token, if it exists."""
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == _hash_refresh_token(token), RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    await db.commit()
+
+
+async def revoke_user_refresh_tokens(db: AsyncSession, user_id: int):
+    """Revokes every outstanding refresh token of a user."""
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    await db.commit()
+
+
+async def revoke_access_token(db: AsyncSession, token: str):
+    """Adds an access token's id to the revocation list until it expires."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    if payload.get("jti"):
+        await revocation_list.revoke(db, payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+
+
+async def get_current_user(db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    """Gets the currently authenticated user from the JWT token.
+
+    Tokens carrying a user id are resolved from the principal cache when possible, so the
+    common case costs no database query. Revoked token ids are screened through the
+    revocation list's Bloom filter. The username and token salt must match the account the
+    id resolves to, and the token version must match its current one, which revokes
+    outstanding tokens when the password changes.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+            raise credentials_exception
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise credentials_exception
 
-    user = get_user_by_username(db, username=username)
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    jti = payload.get("jti")
+    if jti is not None and await revocation_list.is_revoked(db, jti):
+        raise credentials_exception
 
-    return user
+    user_id = payload.get("uid")
+    principal = principal_cache.get(user_id) if user_id is not None else None
+
+    if principal is None:
+        if user_id is not None:
+            user = await db.get(User, user_id)
+        else:
+            user = await get_user_by_username(db, username=username)
+        if user is None:
+            raise credentials_exception
+        principal = CurrentUser.from_user(user)
+        principal_cache.set(principal)
+
+    # The route may await uploads or upstream APIs next; don't hold a pooled connection meanwhile.
+    await end_read_transaction(db)
+
+    if (
+        username != principal.username
+        or payload.get("slt", "") != principal.token_salt
+        or payload.get("ver", 0) != principal.token_version
+    ):
+        raise credentials_exception
+
+    return principal
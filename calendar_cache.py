@@ -0,0 +1,88 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import AgriculturalEvent
+from schemas import AgriculturalEventResponse
+from datetime import date
+from typing import Optional
+import asyncio
+import bisect
+import hashlib
+import time
+import json
+import os
+
+
+CALENDAR_CACHE_TTL_SECONDS = float(os.getenv("CALENDAR_CACHE_TTL_SECONDS", "300"))
+
+
+class CalendarSnapshot:
+    """The whole calendar, serialized once and sorted by (date, id)."""
+
+    def __init__(self, events: list):
+        self.events = events
+        self.dates = [event["date"] for event in events]
+        self.body = json.dumps(events, ensure_ascii=False, separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+
+class CalendarCache:
+    """In-process copy of `agricultural_events`, reloaded from the database every `ttl_seconds`.
+
+    Every query is answered from the snapshot. The ETag is derived from the snapshot's
+    contents, so it changes exactly when the calendar does and clients can revalidate
+    with If-None-Match.
+    """
+
+    def __init__(self, ttl_seconds: float = CALENDAR_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self.loads = 0
+
+    def _expired(self) -> bool:
+        return self._snapshot is None or time.monotonic() - self._loaded_at > self.ttl_seconds
+
+    async def snapshot(self, db: AsyncSession) -> CalendarSnapshot:
+        """Returns the current snapshot, reloading it when it has expired."""
+        if not self._expired():
+            return self._snapshot
+        # Concurrent requests wait for a single reload instead of each running their own.
+        async with self._lock:
+            if self._expired():
+                rows = (await db.scalars(
+                    select(AgriculturalEvent).order_by(AgriculturalEvent.date, AgriculturalEvent.id)
+                )).all()
+                self._snapshot = CalendarSnapshot(
+                    [AgriculturalEventResponse.model_validate(row).model_dump(mode="json") for row in rows]
+                )
+                self._loaded_at = time.monotonic()
+                self.loads += 1
+            return self._snapshot
+
+    def invalidate(self):
+        """Drops the snapshot so the next request reloads it."""
+        self._snapshot = None
+
+    async def query(self, db: AsyncSession, start: Optional[date] = None, end: Optional[date] = None,
+              season: Optional[str] = None, category: Optional[str] = None):
+        """Events between `start` and `end` inclusive that match `season` and `category`, by date."""
+        snapshot = await self.snapshot(db)
+        # ISO dates sort lexically, so the serialized dates can be bisected directly.
+        low = bisect.bisect_left(snapshot.dates, start.isoformat()) if start else 0
+        high = bisect.bisect_right(snapshot.dates, end.isoformat()) if end else len(snapshot.dates)
+        return [
+            event for event in snapshot.events[low:high]
+            if (season is None or event["season"] == season) and (category is None or event["category"] == category)
+        ], snapshot
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names `etag`, comparing weakly."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+calendar_cache = CalendarCache()
@@ -0,0 +1,225 @@
+from http_client import get_with_retry, SingleFlight
+from sqlalchemy import select, func, cast, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SessionLocal, engine
+from models import CommodityTick
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import tempfile
+import time
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks, every worker ingests
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+COMMODITY_API_URL = "https://commodities.g.apised.com/v1/latest"
+COMMODITY_API_KEY = os.getenv("COMMODITY_API_KEY", "sk_EBb3274A836943352279a0a8660C540828AaB82839f874cA")
+COMMODITY_SOURCE = "APIsed Commodities API"
+COMMODITY_CACHE_TTL_SECONDS = float(os.getenv("COMMODITY_CACHE_TTL_SECONDS", "60"))
+COMMODITY_BATCH_MAX_SYMBOLS = int(os.getenv("COMMODITY_BATCH_MAX_SYMBOLS", "50"))
+# Background ingestion: comma-separated symbols polled for each configured currency.
+COMMODITY_INGEST_SYMBOLS = [s.strip().upper() for s in os.getenv("COMMODITY_INGEST_SYMBOLS", "").split(",") if s.strip()]
+COMMODITY_INGEST_CURRENCIES = [c.strip().upper() for c in os.getenv("COMMODITY_INGEST_CURRENCIES", "USD").split(",") if c.strip()]
+COMMODITY_INGEST_INTERVAL_SECONDS = float(os.getenv("COMMODITY_INGEST_INTERVAL_SECONDS", "300"))
+# Stored ticks younger than this are served as the latest price without calling upstream.
+COMMODITY_MAX_AGE_SECONDS = float(os.getenv("COMMODITY_MAX_AGE_SECONDS", str(2 * COMMODITY_INGEST_INTERVAL_SECONDS)))
+# Only the worker holding this lock polls, so WEB_CONCURRENCY workers don't multiply quota use and ticks.
+COMMODITY_INGEST_LOCK_PATH = os.getenv(
+    "COMMODITY_INGEST_LOCK_PATH", os.path.join(tempfile.gettempdir(), "agrical-commodity-ingest.lock")
+)
+
+_quotes = {}
+_calls = SingleFlight()
+_ingest_lock = None
+
+
+class CommodityUnavailable(Exception):
+    """Raised when the commodities API fails or returns something unreadable."""
+
+
+async def _fetch_quotes(symbols: tuple, currency: str) -> dict:
+    response = await get_with_retry(
+        COMMODITY_API_URL,
+        params={"symbols": ",".join(symbols), "base_currency": currency},
+        headers={"x-api-key": COMMODITY_API_KEY},
+    )
+    # A 401/403/429 (bad key, quota) is an outage too, not a response listing no commodities.
+    if not response.is_success:
+        raise CommodityUnavailable(f"Commodities API returned {response.status_code}")
+
+    try:
+        parsed_data = response.json()
+    except ValueError:
+        raise CommodityUnavailable("Invalid response from API")
+
+    data = parsed_data.get("data") or {}
+    rates = data.get("rates") or {}
+    unit = data.get("unit", "Unknown")
+    expires_at = time.monotonic() + COMMODITY_CACHE_TTL_SECONDS
+
+    quotes = {}
+    for symbol in symbols:
+        if symbol in rates:
+            quotes[symbol] = {
+                "commodity": symbol,
+                "currency": currency,
+                "price": rates[symbol],
+                "unit": unit,
+                "source": COMMODITY_SOURCE,
+            }
+            _quotes[(symbol, currency)] = (expires_at, quotes[symbol])
+    return quotes
+
+
+async def get_quotes(symbols, currency: str) -> dict:
+    """Latest quotes by symbol; symbols the API does not know are left out.
+
+    Quotes are cached per (symbol, currency) for COMMODITY_CACHE_TTL_SECONDS. All uncached
+    symbols go upstream in a single comma-separated `symbols` call, and identical
+    concurrent calls share one request.
+    """
+    currency = currency.upper()
+    now = time.monotonic()
+    quotes = {}
+    missing = []
+    for symbol in dict.fromkeys(symbol.upper() for symbol in symbols):
+        cached = _quotes.get((symbol, currency))
+        if cached is not None and cached[0] > now:
+            quotes[symbol] = cached[1]
+        else:
+            missing.append(symbol)
+
+    if missing:
+        key = (tuple(missing), currency)
+        quotes.update(await _calls.do(key, lambda: _fetch_quotes(*key)))
+    return quotes
+
+
+async def record_ticks(db: AsyncSession, quotes, recorded_at: datetime):
+    """Appends one tick per quote to the local time-series table."""
+    db.add_all(
+        CommodityTick(
+            symbol=quote["commodity"],
+            currency=quote["currency"],
+            price=quote["price"],
+            unit=quote["unit"],
+            recorded_at=recorded_at,
+        )
+        for quote in quotes
+    )
+    await db.commit()
+
+
+async def latest_tick(db: AsyncSession, symbol: str, currency: str,
+                      max_age_seconds: float = COMMODITY_MAX_AGE_SECONDS):
+    """Most recent stored tick for a symbol, if it is recent enough to serve."""
+    return await db.scalar(
+        select(CommodityTick)
+        .where(
+            CommodityTick.symbol == symbol,
+            CommodityTick.currency == currency,
+            CommodityTick.recorded_at >= datetime.utcnow() - timedelta(seconds=max_age_seconds),
+        )
+        .order_by(CommodityTick.recorded_at.desc())
+        .limit(1)
+    )
+
+
+def _epoch_seconds(column):
+    if engine.dialect.name == "sqlite":
+        return cast(func.strftime("%s", column), Integer)
+    return cast(func.extract("epoch", column), Integer)
+
+
+async def tick_history(db: AsyncSession, symbol: str, currency: str, start: datetime, end: datetime,
+                 bucket_seconds: int = 0, limit: int = 1000):
+    """Ticks for a symbol in [start, end), or per-bucket aggregates when `bucket_seconds` is set."""
+    in_range = (
+        CommodityTick.symbol == symbol,
+        CommodityTick.currency == currency,
+        CommodityTick.recorded_at >= start,
+        CommodityTick.recorded_at < end,
+    )
+
+    if not bucket_seconds:
+        rows = await db.execute(
+            select(CommodityTick.recorded_at, CommodityTick.price)
+            .where(*in_range)
+            .order_by(CommodityTick.recorded_at)
+            .limit(limit)
+        )
+        return [{"timestamp": recorded_at, "price": price} for recorded_at, price in rows]
+
+    bucket = _epoch_seconds(CommodityTick.recorded_at) // bucket_seconds
+    rows = await db.execute(
+        select(
+            bucket.label("bucket"),
+            func.min(CommodityTick.price),
+            func.max(CommodityTick.price),
+            func.avg(CommodityTick.price),
+            func.count(CommodityTick.id),
+        )
+        .where(*in_range)
+        .group_by("bucket")
+        .order_by("bucket")
+        .limit(limit)
+    )
+    return [
+        {
+            "timestamp": datetime.utcfromtimestamp(index * bucket_seconds),
+            "min": low,
+            "max": high,
+            "avg": average,
+            "count": count,
+        }
+        for index, low, high, average, count in rows
+    ]
+
+
+async def ingest_once():
+    """Polls every configured symbol/currency pair once and stores the ticks."""
+    for currency in COMMODITY_INGEST_CURRENCIES:
+        for start in range(0, len(COMMODITY_INGEST_SYMBOLS), COMMODITY_BATCH_MAX_SYMBOLS):
+            symbols = COMMODITY_INGEST_SYMBOLS[start:start + COMMODITY_BATCH_MAX_SYMBOLS]
+            quotes = await get_quotes(symbols, currency)
+            if quotes:
+                async with SessionLocal() as db:
+                    await record_ticks(db, list(quotes.values()), datetime.utcnow())
+
+
+def _hold_ingest_lock() -> bool:
+    """Whether this worker is the host's ingester, taking the lock file if no other worker holds it.
+
+    The lock is released when the holding process exits, and the others retry every interval.
+    """
+    global _ingest_lock
+    if fcntl is None or _ingest_lock is not None:
+        return True
+    lock_file = open(COMMODITY_INGEST_LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _ingest_lock = lock_file
+    return True
+
+
+async def run_ingester():
+    """Polls the configured commodities every COMMODITY_INGEST_INTERVAL_SECONDS until cancelled,
+    in one worker per host."""
+    while True:
+        try:
+            if _hold_ingest_lock():
+                await ingest_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Commodity price ingestion failed")
+        await asyncio.sleep(COMMODITY_INGEST_INTERVAL_SECONDS)
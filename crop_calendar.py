@@ -0,0 +1,104 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Crop, CropTask
+import asyncio
+import calendar
+import time
+import os
+
+
+CROP_TASK_INDEX_TTL_SECONDS = float(os.getenv("CROP_TASK_INDEX_TTL_SECONDS", "300"))
+
+# Lower-case month names and abbreviations accepted for task months.
+MONTH_ALIASES = {
+    **{name.lower(): number for number, name in enumerate(calendar.month_name) if number},
+    **{name.lower(): number for number, name in enumerate(calendar.month_abbr) if number},
+    "sept": 9,
+}
+
+
+def parse_month(value) -> int:
+    """Month number 1-12 from a month name, abbreviation or number."""
+    text = str(value).strip().lower().rstrip(".")
+    number = int(text) if text.isdigit() else MONTH_ALIASES.get(text)
+    if number is None or not 1 <= number <= 12:
+        raise ValueError(f"Unrecognized month '{value}'")
+    return number
+
+
+def month_name(number: int) -> str:
+    """English name of month `number`."""
+    return calendar.month_name[number]
+
+
+class CropTaskIndex:
+    """Every crop task with a recognized month, materialized as month -> crop id -> tasks.
+
+    Built from two queries and kept until a crop write calls `invalidate` or
+    `ttl_seconds` pass (other workers write too), so a monthly to-do list for
+    any number of crops is a few dictionary lookups.
+    """
+
+    def __init__(self, ttl_seconds: float = CROP_TASK_INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._state = None
+        self._built_at = 0.0
+        # Bumped by `invalidate`, so a build that started before a write is not kept.
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    async def _build(self, db: AsyncSession):
+        generation = self._generation
+        crops = {crop_id: name for crop_id, name in await db.execute(select(Crop.id, Crop.name))}
+        months = {number: {} for number in range(1, 13)}
+        rows = await db.execute(
+            select(CropTask.id, CropTask.month, CropTask.task, CropTask.crop_id, CropTask.month_number)
+            .where(CropTask.month_number.is_not(None))
+            .order_by(CropTask.month_number, CropTask.crop_id, CropTask.id)
+        )
+        for task_id, month, task, crop_id, month_number in rows:
+            months[month_number].setdefault(crop_id, []).append({"id": task_id, "month": month, "task": task})
+        state = (months, crops, {name.lower(): crop_id for crop_id, name in crops.items()})
+        if generation == self._generation:
+            self._state = state
+            self._built_at = time.monotonic()
+        return state
+
+    def _stale(self) -> bool:
+        return self._state is None or time.monotonic() - self._built_at > self.ttl_seconds
+
+    async def _ensure(self, db: AsyncSession):
+        if not self._stale():
+            return self._state
+        async with self._lock:
+            return await self._build(db) if self._stale() else self._state
+
+    def invalidate(self):
+        """Drops the index so the next lookup rebuilds it."""
+        self._generation += 1
+        self._state = None
+
+    async def resolve(self, db: AsyncSession, crops):
+        """Crop ids for a list of crop ids or names, and the entries that matched no crop."""
+        _months, crop_names, ids = await self._ensure(db)
+        found, missing = [], []
+        for crop in crops:
+            crop_id = int(crop) if str(crop).isdigit() else ids.get(str(crop).lower())
+            if crop_id in crop_names:
+                found.append(crop_id)
+            else:
+                missing.append(str(crop))
+        return found, missing
+
+    async def month(self, db: AsyncSession, month_number: int, crop_ids=None) -> list:
+        """Tasks due in a month for `crop_ids` (every crop when None), grouped by crop."""
+        months, crop_names, _ids = await self._ensure(db)
+        tasks_by_crop = months[month_number]
+        crop_ids = sorted(tasks_by_crop) if crop_ids is None else crop_ids
+        return [
+            {"crop_id": crop_id, "crop_name": crop_names[crop_id], "tasks": tasks_by_crop.get(crop_id, [])}
+            for crop_id in crop_ids if crop_id in crop_names
+        ]
+
+
+crop_task_index = CropTaskIndex()
@@ -0,0 +1,213 @@
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+from models import Crop, CropTask
+from schemas import CropCreate
+from crop_calendar import parse_month, month_name
+import codecs
+import csv
+import json
+import os
+
+
+CROP_IMPORT_CHUNK_ROWS = int(os.getenv("CROP_IMPORT_CHUNK_ROWS", "500"))
+CROP_IMPORT_MAX_ERRORS = int(os.getenv("CROP_IMPORT_MAX_ERRORS", "100"))
+
+JSON_MEDIA_TYPE = "application/json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_MEDIA_TYPE = "text/csv"
+IMPORT_MEDIA_TYPES = (JSON_MEDIA_TYPE, NDJSON_MEDIA_TYPE, CSV_MEDIA_TYPE)
+CSV_REQUIRED_COLUMNS = {"name", "month", "task"}
+
+
+class ImportReport:
+    """Counters and per-row errors for one bulk import."""
+
+    def __init__(self):
+        self.rows = 0
+        self.crops_created = 0
+        self.crops_updated = 0
+        self.tasks_inserted = 0
+        self.errors = []
+        self.replaced = set()
+
+    def error(self, row: int, message: str):
+        if len(self.errors) < CROP_IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "crops_created": self.crops_created,
+            "crops_updated": self.crops_updated,
+            "tasks_inserted": self.tasks_inserted,
+            "errors": self.errors,
+        }
+
+
+def _crop_record(data) -> tuple:
+    crop = CropCreate.model_validate(data)
+    if not crop.name.strip():
+        raise ValueError("Crop name is empty")
+    tasks = [(parse_month(task.month), task.task) for task in crop.tasks]
+    return crop.name.strip(), crop.description, tasks
+
+
+def _csv_record(row: dict) -> tuple:
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise ValueError("Crop name is empty")
+    month, task = (row.get("month") or "").strip(), (row.get("task") or "").strip()
+    if bool(month) != bool(task):
+        raise ValueError("month and task must be given together")
+    return name, (row.get("description") or "").strip() or None, [(parse_month(month), task)] if task else []
+
+
+def _error_message(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+    return str(e)
+
+
+async def _lines(stream):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in stream:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def read_records(media_type: str, stream):
+    """Yields (row number, record, error) for each crop row in a request body.
+
+    JSON arrays are read whole; NDJSON and CSV are parsed line by line as the body
+    arrives. A CSV field may span lines when it is quoted.
+    """
+    if media_type == JSON_MEDIA_TYPE:
+        try:
+            items = json.loads(b"".join([chunk async for chunk in stream]))
+        except ValueError as e:
+            yield 0, None, f"Invalid JSON: {e}"
+            return
+        if not isinstance(items, list):
+            yield 0, None, "Expected a JSON array of crops"
+            return
+        for row, item in enumerate(items, start=1):
+            try:
+                yield row, _crop_record(item), None
+            except (ValueError, TypeError) as e:
+                yield row, None, _error_message(e)
+
+    elif media_type == NDJSON_MEDIA_TYPE:
+        row = 0
+        async for line in _lines(stream):
+            row += 1
+            if not line.strip():
+                continue
+            try:
+                yield row, _crop_record(json.loads(line)), None
+            except (ValueError, TypeError) as e:
+                yield row, None, _error_message(e)
+
+    else:
+        header, pending, row = None, "", 0
+        async for line in _lines(stream):
+            pending = f"{pending}\n{line}" if pending else line
+            if pending.count('"') % 2:
+                continue  # inside a quoted field that continues on the next line
+            text, pending = pending, ""
+            if not text.strip():
+                continue
+            values = next(csv.reader([text]))
+            if header is None:
+                header = [value.strip().lower() for value in values]
+                missing = CSV_REQUIRED_COLUMNS - set(header)
+                if missing:
+                    yield 0, None, f"CSV header is missing columns: {', '.join(sorted(missing))}"
+                    return
+                continue
+            row += 1
+            try:
+                yield row, _csv_record(dict(zip(header, values))), None
+            except ValueError as e:
+                yield row, None, str(e)
+
+
+def import_chunk(db: Session, records: list, replace_tasks: bool, report: ImportReport):
+    """Upserts the crops of `records` by name and inserts their tasks, in one transaction.
+
+    Runs on the synchronous session behind an AsyncSession (see `AsyncSession.run_sync`).
+    """
+    descriptions = {}
+    for _, (name, description, _tasks) in records:
+        if description is not None or name not in descriptions:
+            descriptions[name] = description
+
+    ids = dict(db.query(Crop.name, Crop.id).filter(Crop.name.in_(descriptions)))
+    created = [{"name": name, "description": description}
+               for name, description in descriptions.items() if name not in ids]
+    updated = [{"id": ids[name], "description": description}
+               for name, description in descriptions.items() if name in ids and description is not None]
+    if created:
+        db.execute(insert(Crop), created)
+        ids.update(db.query(Crop.name, Crop.id).filter(Crop.name.in_([crop["name"] for crop in created])))
+    if updated:
+        db.execute(update(Crop), updated)
+
+    # Only once per crop and import, so later chunks don't delete tasks inserted by earlier ones.
+    stale = [ids[name] for name in descriptions if ids[name] not in report.replaced] if replace_tasks else []
+    if stale:
+        db.query(CropTask).filter(CropTask.crop_id.in_(stale)).delete(synchronize_session=False)
+
+    tasks = [
+        {"crop_id": ids[name], "month": month_name(month_number), "month_number": month_number, "task": task}
+        for _, (name, _description, crop_tasks) in records
+        for month_number, task in crop_tasks
+    ]
+    if tasks:
+        db.execute(insert(CropTask), tasks)
+    db.commit()
+
+    report.replaced.update(stale)
+    report.crops_created += len(created)
+    report.crops_updated += len(updated)
+    report.tasks_inserted += len(tasks)
+
+
+async def _flush(db: AsyncSession, chunk: list, replace_tasks: bool, report: ImportReport):
+    try:
+        await db.run_sync(import_chunk, chunk, replace_tasks, report)
+    except SQLAlchemyError as e:
+        await db.rollback()
+        for row, _record in chunk:
+            report.error(row, f"Not imported: {e.__class__.__name__}")
+
+
+async def import_crops(db: AsyncSession, media_type: str, stream, replace_tasks: bool = False) -> ImportReport:
+    """Imports crops and tasks from a request body in transactions of `CROP_IMPORT_CHUNK_ROWS` rows.
+
+    Invalid rows are reported and skipped; a chunk that fails to commit is reported row by row
+    and does not affect the chunks before or after it.
+    """
+    report = ImportReport()
+    chunk = []
+    async for row, record, error in read_records(media_type, stream):
+        if row:
+            report.rows += 1
+        if error is not None:
+            report.error(row, error)
+            continue
+        chunk.append((row, record))
+        if len(chunk) >= CROP_IMPORT_CHUNK_ROWS:
+            await _flush(db, chunk, replace_tasks, report)
+            chunk = []
+    if chunk:
+        await _flush(db, chunk, replace_tasks, report)
+    return report
@@ -1,17 +1,235 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.orm import Session, declarative_base
+from crop_calendar import MONTH_ALIASES
+import os
 
-DATABASE_URL = "sqlite:///./app.db"
+# Any SQLAlchemy URL; sqlite:// and postgresql:// URLs are switched to their asyncio drivers.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
+
+# Connection pool for server databases such as PostgreSQL.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative values are KiB, as in PRAGMA cache_size.
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+# One writer connection per process: SQLite takes a single write lock anyway, and waiting
+# for the pooled connection is cheaper than spinning on SQLITE_BUSY. Write transactions must
+# therefore not span an await on anything but the database (bcrypt, upstream APIs, request
+# bodies): commit first. See `end_read_transaction` for reads.
+SQLITE_WRITE_POOL_SIZE = int(os.getenv("SQLITE_WRITE_POOL_SIZE", "1"))
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+def async_url(url: str):
+    """`url` with its driver swapped for the asyncio one (aiosqlite, asyncpg) when it names a sync driver."""
+    url = make_url(url)
+    if "+" not in url.drivername and url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    elif url.get_backend_name() == "postgresql" and url.get_driver_name() in ("psycopg2", "psycopg"):
+        url = url.set(drivername=ASYNC_DRIVERS["postgresql"])
+    return url
+
+
+def _sqlite_file(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _configure_sqlite(engine, read_only: bool):
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy issue BEGIN itself instead of the driver's implicit, deferred one.
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        if not read_only:
+            cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def begin(connection):
+        # Readers only ever see committed WAL snapshots; writers take the write lock up front so
+        # a transaction never fails upgrading a read lock, which busy_timeout cannot wait out.
+        connection.exec_driver_sql("BEGIN" if read_only else "BEGIN IMMEDIATE")
+
+
+_url = async_url(DATABASE_URL)
+
+if _sqlite_file(_url):
+    engine = create_async_engine(
+        _url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=SQLITE_WRITE_POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+    )
+    read_engine = create_async_engine(
+        _url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=SQLITE_READ_POOL_SIZE,
+        max_overflow=SQLITE_READ_POOL_SIZE,
+    )
+    _configure_sqlite(engine, read_only=False)
+    _configure_sqlite(read_engine, read_only=True)
+elif _url.get_backend_name() == "sqlite":
+    engine = create_async_engine(_url)
+    read_engine = engine
+else:
+    engine = create_async_engine(
+        _url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+    )
+    read_engine = engine
+
+
+class RoutingSession(Session):
+    """Runs SELECTs on the read engine and everything else on the writer.
+
+    Once a transaction has written, its later reads go to the writer too, so they see
+    the transaction's own uncommitted rows.
+    """
+
+    _writing = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._writing or self._flushing or not getattr(clause, "is_select", False):
+            self._writing = True
+            return engine.sync_engine
+        return read_engine.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _end_routing(session, transaction):
+    if transaction.parent is None:
+        session._writing = False
+
+
+# Objects stay loaded after commit: with AsyncSession an expired attribute cannot be lazily
+# reloaded from request code, so handlers refresh explicitly when they need server defaults.
+SessionLocal = async_sessionmaker(sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False)
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
+async def end_read_transaction(db: AsyncSession):
+    """Ends a session's read transaction, returning its pooled connection before a slow await.
+
+    A session keeps its connection from the first query until commit, so call this before
+    awaiting bcrypt, an upstream API or a request body. It is only for sessions that have
+    not written; a write transaction is committed instead.
+    """
+    assert not db.sync_session._writing and not (db.new or db.dirty or db.deleted), \
+        "end_read_transaction called with uncommitted writes"
+    await db.commit()
+
+
+
+def _month_number_sql(is_digits: str) -> str:
+    """`crop_calendar.parse_month` in SQL, so existing rows resolve the same way new ones do.
+
+    Only all-digit values are cast; anything else that is not a month alias stays NULL.
+    """
+    aliases = " ".join(f"WHEN '{alias}' THEN {number}" for alias, number in MONTH_ALIASES.items())
+    return (
+        f"CASE rtrim(lower(trim(month)), '.') {aliases} "
+        f"ELSE CASE WHEN {is_digits} THEN CAST(trim(month) AS INTEGER) END END"
+    )
+
+
+def _month_number_backfill(is_digits: str) -> str:
+    month_number = _month_number_sql(is_digits)
+    return f"UPDATE crop_tasks SET month_number = {month_number} WHERE {month_number} BETWEEN 1 AND 12"
+
+
+# Statements that fill a column in for existing rows when `_add_missing_columns` adds it,
+# either one statement or one per dialect name.
+BACKFILLS = {
+    ("users", "token_salt"): {
+        "sqlite": "UPDATE users SET token_salt = lower(hex(randomblob(8)))",
+        "postgresql": "UPDATE users SET token_salt = substr(md5(random()::text || id::text), 1, 16)",
+    },
+    ("crop_tasks", "month_number"): {
+        "sqlite": _month_number_backfill("trim(month) <> '' AND trim(month) NOT GLOB '*[^0-9]*'"),
+        "postgresql": _month_number_backfill("trim(month) ~ '^[0-9]+$'"),
+    },
+    ("posts", "comment_count"): (
+        "UPDATE posts SET comment_count = (SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id)"
+    ),
+    ("posts", "last_activity_at"): (
+        "UPDATE posts SET last_activity_at = COALESCE("
+        "(SELECT MAX(created_at) FROM comments WHERE comments.post_id = posts.id), posts.created_at)"
+    ),
+}
+
+
+def _add_missing_columns(connection, metadata):
+    """Adds columns declared on the models but missing from existing tables."""
+    inspector = inspect(connection)
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+                backfill = BACKFILLS.get((table.name, column.name))
+                if isinstance(backfill, dict):
+                    backfill = backfill.get(connection.dialect.name)
+                if backfill:
+                    connection.exec_driver_sql(backfill)
+
+
+def _create_missing_indexes(connection, metadata):
+    """Creates indexes declared on the models but missing from existing tables."""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _init_schema(connection):
+    import models
+    import search
+    import geo
+
+    _add_missing_columns(connection, models.Base.metadata)
+    models.Base.metadata.create_all(bind=connection)
+    _create_missing_indexes(connection, models.Base.metadata)
+    search.create_search_index(connection)
+    geo.create_geo_index(connection)
+
+
+async def init_db():
+    """Creates missing tables, columns and indexes, and the full-text search and spatial indexes."""
+    async with engine.begin() as connection:
+        await connection.run_sync(_init_schema)
+
+
+async def close_db():
+    """Closes every pooled connection."""
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
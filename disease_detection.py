@@ -1,23 +1,231 @@
-from transformers import ViTForImageClassification, ViTImageProcessor
-from PIL import Image
-import torch
+from inference import BatchScheduler
+from prediction_cache import PredictionCache
+from image_pipeline import decode_image, ImageTooLarge, IMAGE_MAX_UPLOAD_BYTES
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import zipfile
+import os
 
+logger = logging.getLogger(__name__)
 
-model_name = "wambugu71/crop_leaf_diseases_vit"
-model = ViTForImageClassification.from_pretrained(model_name)
-feature_extractor = ViTImageProcessor.from_pretrained(model_name)
+model_name = os.getenv("DISEASE_MODEL_NAME", "wambugu71/crop_leaf_diseases_vit")
+model_revision = os.getenv("DISEASE_MODEL_REVISION") or None
+# "default" keeps the float32 model, "quantized" applies dynamic int8 quantization to the
+# Linear layers, "torchscript" traces and freezes the network for the CPU.
+MODEL_VARIANT = os.getenv("DISEASE_MODEL_VARIANT", "default")
+MODEL_VARIANTS = ("default", "quantized", "torchscript")
+MODEL_WARMUP = os.getenv("DISEASE_MODEL_WARMUP", "0") == "1"
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
 
-def predict_disease(image_file):
+PREDICT_BATCH_CHUNK_SIZE = int(os.getenv("PREDICT_BATCH_CHUNK_SIZE", "32"))
+PREDICT_BATCH_MAX_IMAGES = int(os.getenv("PREDICT_BATCH_MAX_IMAGES", "200"))
+PREDICT_BATCH_MAX_ENTRY_BYTES = int(os.getenv("PREDICT_BATCH_MAX_ENTRY_BYTES", str(20 * 1024 * 1024)))
+# Raw image bytes one batch request may hold in memory, across all uploads and archive entries.
+PREDICT_BATCH_MAX_TOTAL_BYTES = int(os.getenv("PREDICT_BATCH_MAX_TOTAL_BYTES", str(100 * 1024 * 1024)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+preprocess_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREPROCESS_WORKERS", str(min(8, os.cpu_count() or 1)))),
+    thread_name_prefix="preprocess",
+)
+
+
+class DiseaseModel:
+    """A loaded classifier variant together with its image processor and labels."""
+
+    def __init__(self, network, feature_extractor, labels, traced: bool = False):
+        self.network = network
+        self.feature_extractor = feature_extractor
+        self.labels = labels
+        self.traced = traced
+
+    def logits(self, pixel_values):
+        outputs = self.network(pixel_values)
+        return outputs[0] if self.traced else outputs.logits
+
+
+_model = None
+_model_error = None
+_model_lock = threading.Lock()
+_warmup_thread = None
+
+
+def torch_num_threads() -> int:
+    """Intra-op threads per worker: TORCH_NUM_THREADS, or the cores split across WEB_CONCURRENCY workers."""
+    if TORCH_NUM_THREADS > 0:
+        return TORCH_NUM_THREADS
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _load_model() -> DiseaseModel:
+    import torch
+    from transformers import ViTForImageClassification, ViTImageProcessor
+
+    if MODEL_VARIANT not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown DISEASE_MODEL_VARIANT '{MODEL_VARIANT}', expected one of {MODEL_VARIANTS}")
+
+    torch.set_num_threads(torch_num_threads())
+
+    feature_extractor = ViTImageProcessor.from_pretrained(model_name, revision=model_revision)
+    network = ViTForImageClassification.from_pretrained(
+        model_name, revision=model_revision, torchscript=MODEL_VARIANT == "torchscript"
+    )
+    network.eval()
+    labels = network.config.id2label
+
+    if MODEL_VARIANT == "quantized":
+        network = torch.ao.quantization.quantize_dynamic(network, {torch.nn.Linear}, dtype=torch.qint8)
+    elif MODEL_VARIANT == "torchscript":
+        size = feature_extractor.size
+        example = torch.zeros(1, 3, size["height"], size["width"])
+        with torch.no_grad():
+            network = torch.jit.freeze(torch.jit.trace(network, example))
+
+    logger.info("Loaded disease model %s (%s variant, %d threads)", model_name, MODEL_VARIANT, torch.get_num_threads())
+    return DiseaseModel(network, feature_extractor, labels, traced=MODEL_VARIANT == "torchscript")
+
+
+def get_model() -> DiseaseModel:
+    """Returns the disease model, loading it on first use."""
+    global _model, _model_error
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                try:
+                    _model = _load_model()
+                    _model_error = None
+                except Exception as e:
+                    _model_error = str(e)
+                    raise
+    return _model
+
+
+def _warm_up():
     try:
-        image = Image.open(image_file).convert("RGB")
-        inputs = feature_extractor(images=image, return_tensors="pt")
-
-        outputs = model(**inputs)
-        logits = outputs.logits
-        predicted_class = torch.argmax(logits).item()
-
-        # Get class labels
-        labels = model.config.id2label
-        return {"predicted_class": labels[predicted_class]}
-    except Exception as e:
-        return {"error": str(e)}
+        get_model()
+    except Exception:
+        logger.exception("Disease model warm-up failed")
+
+
+def start_model_warmup():
+    """Loads the model on a background thread so the first prediction does not pay for it."""
+    global _warmup_thread
+    if _model is None and (_warmup_thread is None or not _warmup_thread.is_alive()):
+        _warmup_thread = threading.Thread(target=_warm_up, name="disease-model-warmup", daemon=True)
+        _warmup_thread.start()
+
+
+def model_status() -> dict:
+    """Readiness of the disease model."""
+    return {
+        "name": model_name,
+        "revision": model_revision,
+        "variant": MODEL_VARIANT,
+        "ready": _model is not None,
+        "loading": _warmup_thread is not None and _warmup_thread.is_alive(),
+        "error": _model_error,
+    }
+
+
+def model_identity() -> str:
+    """Name, revision and variant of the configured model, used to namespace cached predictions."""
+    return f"{model_name}@{model_revision or 'main'}/{MODEL_VARIANT}"
+
+
+def predict_disease_batch(images):
+    """Runs a single forward pass over a list of RGB images and returns one label per image."""
+    import torch
+
+    disease_model = get_model()
+    inputs = disease_model.feature_extractor(images=images, return_tensors="pt")
+
+    with torch.inference_mode():
+        logits = disease_model.logits(inputs["pixel_values"])
+
+    labels = disease_model.labels
+    return [{"predicted_class": labels[index]} for index in torch.argmax(logits, dim=-1).tolist()]
+
+
+def preprocess_image(image_bytes: bytes):
+    """Decodes raw image bytes and returns the model's pixel tensor for a single image."""
+    image = decode_image(image_bytes)
+    return get_model().feature_extractor(images=image, return_tensors="pt")["pixel_values"][0]
+
+
+def predict_top_k(pixel_values, top_k: int = 3):
+    """Classifies preprocessed images in fixed-size chunks and returns the top-k labels with softmax scores."""
+    import torch
+
+    disease_model = get_model()
+    labels = disease_model.labels
+    top_k = min(top_k, len(labels))
+    results = []
+
+    with torch.inference_mode():
+        for start in range(0, len(pixel_values), PREDICT_BATCH_CHUNK_SIZE):
+            chunk = torch.stack(pixel_values[start:start + PREDICT_BATCH_CHUNK_SIZE])
+            probabilities = torch.softmax(disease_model.logits(chunk), dim=-1)
+            scores, indices = probabilities.topk(top_k, dim=-1)
+            for row_scores, row_indices in zip(scores.tolist(), indices.tolist()):
+                results.append([
+                    {"label": labels[index], "score": score}
+                    for score, index in zip(row_scores, row_indices)
+                ])
+
+    return results
+
+
+def read_batch_uploads(uploads):
+    """Reads (filename, bytes) pairs from uploaded images, expanding zip archives into their image entries.
+
+    Raises ImageTooLarge once the images together exceed PREDICT_BATCH_MAX_TOTAL_BYTES.
+    """
+    too_large = ImageTooLarge(f"Images exceed the {PREDICT_BATCH_MAX_TOTAL_BYTES} byte batch limit")
+    images = []
+    total = 0
+    for upload in uploads:
+        filename = upload.filename or "upload"
+        if filename.lower().endswith(".zip") or upload.content_type in ("application/zip", "application/x-zip-compressed"):
+            with zipfile.ZipFile(upload.file) as archive:
+                for entry in archive.infolist():
+                    if entry.is_dir() or entry.filename.startswith("__MACOSX/"):
+                        continue
+                    if not entry.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    if entry.file_size > PREDICT_BATCH_MAX_ENTRY_BYTES:
+                        raise ValueError(f"Archive entry '{entry.filename}' is too large")
+                    total += entry.file_size
+                    if total > PREDICT_BATCH_MAX_TOTAL_BYTES:
+                        raise too_large
+                    images.append((entry.filename, archive.read(entry)))
+                    if len(images) > PREDICT_BATCH_MAX_IMAGES:
+                        raise ValueError(f"At most {PREDICT_BATCH_MAX_IMAGES} images can be predicted per request")
+        else:
+            data = upload.file.read(min(IMAGE_MAX_UPLOAD_BYTES, PREDICT_BATCH_MAX_TOTAL_BYTES - total) + 1)
+            if len(data) > IMAGE_MAX_UPLOAD_BYTES:
+                raise ImageTooLarge(f"'{filename}' exceeds the {IMAGE_MAX_UPLOAD_BYTES} byte upload limit")
+            total += len(data)
+            if total > PREDICT_BATCH_MAX_TOTAL_BYTES:
+                raise too_large
+            images.append((filename, data))
+
+        if len(images) > PREDICT_BATCH_MAX_IMAGES:
+            raise ValueError(f"At most {PREDICT_BATCH_MAX_IMAGES} images can be predicted per request")
+
+    return images
+
+
+disease_scheduler = BatchScheduler(
+    predict_disease_batch,
+    max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16")),
+    max_wait_ms=float(os.getenv("INFERENCE_MAX_WAIT_MS", "10")),
+)
+
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "1024")),
+    sqlite_path=os.getenv("PREDICTION_CACHE_DB") or None,
+    ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    max_rows=int(os.getenv("PREDICTION_CACHE_MAX_ROWS", "100000")),
+)
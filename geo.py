@@ -0,0 +1,120 @@
+from sqlalchemy import select, text, Integer
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import ServiceProvider
+from typing import Optional
+import logging
+import math
+import os
+
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LATITUDE = 111.32
+NEARBY_INITIAL_RADIUS_KM = float(os.getenv("NEARBY_INITIAL_RADIUS_KM", "10"))
+NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", "500"))
+
+rtree_available = False
+
+
+def create_geo_index(connection):
+    """Creates the R*Tree over provider coordinates and its sync triggers, indexing existing rows the first time."""
+    global rtree_available
+    if connection.dialect.name != "sqlite":
+        return
+
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'service_providers_rtree'"
+    ).first()
+    located = "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL"
+    insert = (
+        "INSERT INTO service_providers_rtree "
+        f"SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude {located};"
+    )
+    delete = "DELETE FROM service_providers_rtree WHERE id = old.id;"
+    try:
+        if not exists:
+            connection.exec_driver_sql(
+                "CREATE VIRTUAL TABLE service_providers_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+            )
+            connection.exec_driver_sql(
+                "INSERT INTO service_providers_rtree SELECT id, latitude, latitude, longitude, longitude "
+                "FROM service_providers WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+            )
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS service_providers_rtree_insert AFTER INSERT ON service_providers "
+            f"BEGIN {insert} END"
+        )
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS service_providers_rtree_delete AFTER DELETE ON service_providers "
+            f"BEGIN {delete} END"
+        )
+        connection.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS service_providers_rtree_update "
+            f"AFTER UPDATE OF latitude, longitude ON service_providers BEGIN {delete} {insert} END"
+        )
+    except OperationalError as e:
+        if "rtree" not in str(e):
+            raise
+        logger.warning("SQLite has no R*Tree support; nearby searches fall back to a coordinate range scan")
+        return
+    rtree_available = True
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi, d_lambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle of `radius_km` around a point."""
+    d_lat = radius_km / KM_PER_DEGREE_LATITUDE
+    cos_lat = math.cos(math.radians(lat))
+    d_lon = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE_LATITUDE * cos_lat))
+    return max(-90.0, lat - d_lat), min(90.0, lat + d_lat), max(-180.0, lon - d_lon), min(180.0, lon + d_lon)
+
+
+async def _candidates(db: AsyncSession, box, category: Optional[str]):
+    min_lat, max_lat, min_lon, max_lon = box
+    query = select(ServiceProvider)
+    if rtree_available:
+        ids = text(
+            "SELECT id FROM service_providers_rtree WHERE max_lat >= :min_lat AND min_lat <= :max_lat "
+            "AND max_lon >= :min_lon AND min_lon <= :max_lon"
+        ).bindparams(min_lat=min_lat, max_lat=max_lat, min_lon=min_lon, max_lon=max_lon).columns(id=Integer)
+        query = query.where(ServiceProvider.id.in_(ids))
+    else:
+        query = query.where(
+            ServiceProvider.latitude.between(min_lat, max_lat),
+            ServiceProvider.longitude.between(min_lon, max_lon),
+        )
+    if category is not None:
+        query = query.where(ServiceProvider.category == category)
+    return (await db.scalars(query)).all()
+
+
+async def nearby(db: AsyncSession, lat: float, lon: float, k: int, max_radius_km: float = NEARBY_MAX_RADIUS_KM,
+           category: Optional[str] = None):
+    """The `k` providers closest to a point within `max_radius_km`, as (provider, distance_km) pairs.
+
+    The spatial index answers bounding-box queries, so the box starts small and doubles until
+    it holds `k` providers within its inscribed circle; only those candidates are ranked by
+    exact distance. Boxes are not wrapped across the antimeridian.
+    """
+    radius = min(NEARBY_INITIAL_RADIUS_KM, max_radius_km)
+    while True:
+        ranked = sorted(
+            (
+                (provider, haversine_km(lat, lon, provider.latitude, provider.longitude))
+                for provider in await _candidates(db, bounding_box(lat, lon, radius), category)
+            ),
+            key=lambda pair: pair[1],
+        )
+        within = [pair for pair in ranked if pair[1] <= radius]
+        if len(within) >= k or radius >= max_radius_km:
+            return within[:k]
+        radius = min(radius * 2, max_radius_km)
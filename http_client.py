@@ -0,0 +1,74 @@
+import asyncio
+import random
+import os
+import httpx
+
+
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_SECONDS = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.25"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Returns the process-wide HTTP client, whose connection pool keeps upstream connections alive."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    """Closes the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def get_with_retry(url: str, params=None, headers=None, retries: int = HTTP_RETRIES) -> httpx.Response:
+    """GETs `url` on the shared client, retrying transport errors and 429/5xx with jittered exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            response = await get_client().get(url, params=params, headers=headers)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == retries:
+                return response
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(HTTP_BACKOFF_SECONDS * 2 ** attempt * (1 + random.random()))
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single in-flight call."""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """Awaits `fn()`, or the call already running for `key`."""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so one caller disconnecting does not cancel the call for the others.
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            future.exception()  # mark as retrieved when every caller went away
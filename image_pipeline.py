@@ -0,0 +1,66 @@
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import asyncio
+import io
+import os
+
+
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "60000000"))
+# Smallest side the decoder has to produce; the ViT processor resizes to 224x224 afterwards.
+IMAGE_DECODE_TARGET = int(os.getenv("IMAGE_DECODE_TARGET", "224"))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+decode_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("IMAGE_DECODE_WORKERS", str(min(8, os.cpu_count() or 1)))),
+    thread_name_prefix="image-decode",
+)
+
+
+class ImageTooLarge(ValueError):
+    """Raised when an upload exceeds the configured byte or pixel limits."""
+
+
+async def read_upload(upload, max_bytes: int = IMAGE_MAX_UPLOAD_BYTES) -> bytes:
+    """Reads an UploadFile in chunks, refusing it as soon as it grows past `max_bytes`."""
+    chunks = []
+    total = 0
+    while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+        total += len(chunk)
+        if total > max_bytes:
+            raise ImageTooLarge(f"Image exceeds the {max_bytes} byte upload limit")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def decode_image(data: bytes, target: int = IMAGE_DECODE_TARGET) -> Image.Image:
+    """Decodes image bytes to RGB at close to the model's input resolution.
+
+    Only the header is parsed before the pixel limit is checked. JPEGs are then decoded
+    directly at a reduced DCT scale via `draft`, and other formats are shrunk with an
+    integer `reduce` right after decoding, so full-resolution frames never go through
+    the RGB conversion.
+    """
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(f"Image is {width}x{height}, above the {IMAGE_MAX_PIXELS} pixel limit")
+
+    if image.format == "JPEG":
+        image.draft("RGB", (target, target))
+    else:
+        factor = min(width, height) // target
+        if factor >= 2:
+            if image.mode in ("P", "1") or image.mode.startswith("I;"):
+                # `reduce` can't average palette indices or packed modes; sample them at the
+                # reduced size instead and convert the small image.
+                image = image.resize((width // factor, height // factor), Image.NEAREST)
+            else:
+                image = image.reduce(factor)
+
+    return image.convert("RGB")
+
+
+async def decode_image_async(data: bytes) -> Image.Image:
+    """Runs `decode_image` on the decode pool, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(decode_pool, decode_image, data)
@@ -0,0 +1,106 @@
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BatchScheduler:
+    """Collects concurrent inference requests into batches and runs them on a dedicated worker thread.
+
+    Requests are queued on the event loop; a collector task takes the first waiting item,
+    keeps gathering until `max_batch_size` items are queued or `max_wait_ms` has passed,
+    then hands the whole batch to `batch_fn` on the worker and resolves each request's future.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 16, max_wait_ms: float = 10):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._queue = None
+        self._collector = None
+        self._in_flight = 0
+        self.requests_total = 0
+        self.batches_total = 0
+        self.batch_sizes = Counter()
+
+    def _ensure_started(self):
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.get_running_loop().create_task(self._collect())
+
+    async def submit(self, item):
+        """Queues one item for batched inference and waits for its result."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        self.requests_total += 1
+        return await future
+
+    async def run(self, fn, *args):
+        """Runs `fn` on the inference worker, serialized with the scheduled batches."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Requests whose client went away are dropped before they reach the model.
+        return [(item, future) for item, future in batch if not future.done()]
+
+    async def _collect(self):
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+
+            self._in_flight = len(batch)
+            self.batches_total += 1
+            self.batch_sizes[len(batch)] += 1
+            try:
+                results = await self.run(self.batch_fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self._in_flight = 0
+
+    def stats(self) -> dict:
+        """Returns queue depth and batch-size histogram counters."""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": self._in_flight,
+            "requests_total": self.requests_total,
+            "batches_total": self.batches_total,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batch_size_histogram": {size: self.batch_sizes[size] for size in sorted(self.batch_sizes)},
+        }
+
+    async def close(self):
+        """Stops the collector task and the worker thread."""
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,37 @@
 from fastapi import FastAPI, Depends
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.openapi.utils import get_openapi
+from contextlib import asynccontextmanager
 from routes import router
+from disease_detection import disease_scheduler, start_model_warmup, MODEL_WARMUP
+from http_client import close_client
+from commodities import run_ingester, COMMODITY_INGEST_SYMBOLS
+from database import init_db, close_db
+from revocation import run_purger
+import asyncio
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    if MODEL_WARMUP:
+        start_model_warmup()
+    ingester = asyncio.create_task(run_ingester()) if COMMODITY_INGEST_SYMBOLS else None
+    purger = asyncio.create_task(run_purger())
+    yield
+    purger.cancel()
+    if ingester is not None:
+        ingester.cancel()
+    await disease_scheduler.close()
+    await close_client()
+    await close_db()
+
 
 app = FastAPI(
     title="AgriCal",
     description="API for managing Tunisia's agricultural calendar, weather, and commodity pricing.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
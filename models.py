@@ -1,12 +1,15 @@
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey, Text, DateTime, func, Date
+from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey, Text, DateTime, func, Date, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
+import secrets
 
 Base = declarative_base()
 
 
 class User(Base):
     __tablename__ = "users"
+    # Ids of deleted users are never handed out again (on databases created from here on).
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, nullable=False)
@@ -14,6 +17,9 @@ class User(Base):
     full_name = Column(String, nullable=True)
     hashed_password = Column(String, nullable=False)
     is_admin = Column(Boolean, default=False)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Random per account and carried in access tokens, so tokens never outlive the account they were issued to.
+    token_salt = Column(String, nullable=False, default=lambda: secrets.token_hex(8), server_default="")
     created_at = Column(TIMESTAMP, server_default=func.datetime("now"))
 
     # Relationships
@@ -21,6 +27,7 @@ class User(Base):
     comments = relationship("Comment", back_populates="user", cascade="all, delete-orphan")
     services = relationship("ServiceProvider", back_populates="user", cascade="all, delete-orphan")
     requests = relationship("ServiceRequest", back_populates="user", cascade="all, delete-orphan")
+    refresh_tokens = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan")
 
 
 class Post(Base):
@@ -31,11 +38,20 @@ class Post(Base):
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
+    # Denormalized from `comments`; kept up to date by the forum routes.
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_activity_at = Column(DateTime, default=func.now())
 
     # Relationships
     user = relationship("User", back_populates="posts")
     comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_posts_last_activity_at_id", "last_activity_at", "id"),
+    )
+
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -50,6 +66,10 @@ class Comment(Base):
     user = relationship("User", back_populates="comments")
     post = relationship("Post", back_populates="comments")
 
+    __table_args__ = (
+        Index("ix_comments_post_id_created_at_id", "post_id", "created_at", "id"),
+    )
+
 
 class Crop(Base):
     __tablename__ = "crops"
@@ -67,12 +87,19 @@ class CropTask(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     month = Column(String, nullable=False)
+    # 1-12, parsed from `month` (see crop_calendar.parse_month).
+    month_number = Column(Integer, nullable=True)
     task = Column(Text, nullable=False)
     crop_id = Column(Integer, ForeignKey("crops.id"))
 
     # Relationships
     crop = relationship("Crop", back_populates="tasks")
 
+    __table_args__ = (
+        Index("ix_crop_tasks_month_number_crop_id", "month_number", "crop_id"),
+        Index("ix_crop_tasks_crop_id_month_number", "crop_id", "month_number"),
+    )
+
 
 class ServiceProvider(Base):
     __tablename__ = "service_providers"
@@ -81,6 +108,10 @@ class ServiceProvider(Base):
     name = Column(String, nullable=False)
     description = Column(Text, nullable=False)
     contact_info = Column(String, nullable=False)
+    category = Column(String, nullable=True)
+    # Indexed spatially by the `service_providers_rtree` table (see geo.py).
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
 
@@ -88,6 +119,11 @@ class ServiceProvider(Base):
     user = relationship("User", back_populates="services")
     requests = relationship("ServiceRequest", back_populates="service_provider", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_service_providers_created_at_id", "created_at", "id"),
+        Index("ix_service_providers_category_created_at_id", "category", "created_at", "id"),
+    )
+
 
 class ServiceRequest(Base):
     __tablename__ = "service_requests"
@@ -102,6 +138,10 @@ class ServiceRequest(Base):
     service_provider = relationship("ServiceProvider", back_populates="requests")
     user = relationship("User", back_populates="requests")
 
+    __table_args__ = (
+        Index("ix_service_requests_service_provider_id_created_at_id", "service_provider_id", "created_at", "id"),
+    )
+
 class AgriculturalEvent(Base):
     __tablename__ = "agricultural_events"
 
@@ -111,4 +151,47 @@ class AgriculturalEvent(Base):
     date = Column(Date, nullable=False)
     season = Column(String, nullable=True)
     category = Column(String, nullable=True)
-    tasks = Column(Text, nullable=True)
\ No newline at end of file
+    tasks = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_agricultural_events_date_id", "date", "id"),
+        Index("ix_agricultural_events_season_date", "season", "date"),
+        Index("ix_agricultural_events_category_date", "category", "date"),
+    )
+
+
+class CommodityTick(Base):
+    __tablename__ = "commodity_ticks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String, nullable=False)
+    currency = Column(String, nullable=False)
+    price = Column(Float, nullable=False)
+    unit = Column(String, nullable=True)
+    recorded_at = Column(DateTime, nullable=False, default=func.now())
+
+    __table_args__ = (
+        Index("ix_commodity_ticks_symbol_currency_recorded_at", "symbol", "currency", "recorded_at"),
+    )
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String, nullable=False, unique=True)
+    family_id = Column(String, nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    created_at = Column(DateTime, default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    user = relationship("User", back_populates="refresh_tokens")
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
\ No newline at end of file
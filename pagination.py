@@ -0,0 +1,98 @@
+from sqlalchemy import tuple_, literal, String, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import TypeDecorator
+from datetime import datetime
+from typing import Optional
+import base64
+import json
+import os
+
+
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "20"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "100"))
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(values) -> str:
+    """Opaque cursor for the sort key of the last row on a page."""
+    raw = json.dumps([value.isoformat(sep=" ") if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+class StoredTimestamp(TypeDecorator):
+    """A DateTime bound, on SQLite, in the text form CURRENT_TIMESTAMP stores ("YYYY-MM-DD HH:MM:SS").
+
+    SQLite's DateTime bind processor always appends ".000000", which makes a stored row compare
+    as earlier than its own timestamp. Other databases compare real timestamps.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(String() if dialect.name == "sqlite" else DateTime())
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and dialect.name == "sqlite":
+            return value.isoformat(sep=" ")
+        return value
+
+
+def stored_timestamp(value: datetime):
+    """Binds `value` for comparison with a timestamp column."""
+    return literal(value, StoredTimestamp())
+
+
+def _cursor_bind(column, value):
+    if column.type.python_type is datetime:
+        return stored_timestamp(datetime.fromisoformat(value))
+    return literal(column.type.python_type(value), column.type)
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    """Decodes `cursor` back into one bound value per sort column."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("wrong number of values")
+        return [_cursor_bind(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+
+
+def project(model, fields: Optional[str], allowed, always=("id", "created_at")) -> list:
+    """Columns of `model` named in the comma-separated `fields`, plus the sort key columns."""
+    if not fields:
+        names = list(allowed)
+    else:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = sorted(set(names) - set(allowed))
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Choose from: {', '.join(allowed)}")
+    names += [name for name in always if name not in names]
+    return [getattr(model, name) for name in names]
+
+
+async def paginate(db: AsyncSession, statement, columns, cursor: Optional[str], limit: int):
+    """Newest-first page of `statement` ordered by `columns`, starting after `cursor`.
+
+    The cursor is compared as a row value, `(created_at, id) < (:created_at, :id)`,
+    so each page is an index range scan no matter how deep the client has paged.
+    Returns the rows (ORM objects when `statement` selects one entity) and the cursor
+    for the next page, or None on the last page.
+    """
+    if cursor:
+        statement = statement.where(tuple_(*columns) < tuple_(*decode_cursor(cursor, columns)))
+    result = await db.execute(statement.order_by(*(column.desc() for column in columns)).limit(limit + 1))
+    descriptions = statement.column_descriptions
+    selects_entity = len(descriptions) == 1 and isinstance(descriptions[0]["expr"], type)
+    rows = result.scalars().all() if selects_entity else result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
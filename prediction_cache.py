@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import sqlite3
+import threading
+import time
+import json
+
+
+class PredictionCache:
+    """Prediction results keyed by a hash of the image bytes and the model identity.
+
+    Lookups go to an in-memory LRU first and then, when `sqlite_path` is set, to a
+    persistent SQLite table shared by every worker on the host. Both tiers expire
+    entries after `ttl_seconds`; the SQLite tier is trimmed back to `max_rows`
+    least recently written entries.
+    """
+
+    def __init__(self, max_entries: int = 1024, sqlite_path: Optional[str] = None,
+                 ttl_seconds: float = 7 * 24 * 3600, max_rows: int = 100_000):
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_trim = 0
+        self.memory_hits = 0
+        self.sqlite_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(image_bytes: bytes, namespace: str) -> str:
+        """Cache key for an image under a model/result namespace."""
+        return f"{hashlib.sha256(image_bytes).hexdigest()}:{namespace}"
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.sqlite_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS prediction_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_prediction_cache_created_at ON prediction_cache (created_at)"
+            )
+        return self._conn
+
+    def _remember(self, key: str, value, expires_at: float):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str):
+        """Returns the cached result for `key`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            if self.sqlite_path:
+                row = self._connection().execute(
+                    "SELECT value, created_at FROM prediction_cache WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl_seconds),
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1] + self.ttl_seconds)
+                    self.sqlite_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value):
+        """Stores a result in both tiers."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now + self.ttl_seconds)
+
+            if self.sqlite_path:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO prediction_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), now),
+                )
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= 100:
+                    self._trim(conn, now)
+
+    def _trim(self, conn, now: float):
+        self._writes_since_trim = 0
+        conn.execute("DELETE FROM prediction_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM prediction_cache WHERE key IN ("
+            "SELECT key FROM prediction_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    def stats(self) -> dict:
+        """Hit/miss counters for both tiers."""
+        lookups = self.memory_hits + self.sqlite_hits + self.misses
+        return {
+            "memory_entries": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "sqlite_hits": self.sqlite_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.memory_hits + self.sqlite_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,114 @@
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import RevokedToken
+from database import SessionLocal
+from datetime import datetime
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+# Other workers revoke tokens too; each worker rebuilds its filter from the table this often.
+REVOCATION_RELOAD_SECONDS = float(os.getenv("REVOCATION_RELOAD_SECONDS", "30"))
+REVOCATION_PURGE_INTERVAL_SECONDS = float(os.getenv("REVOCATION_PURGE_INTERVAL_SECONDS", "3600"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing of a BLAKE2b digest."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """Revoked access-token ids, stored in `revoked_tokens` and screened by an in-memory Bloom filter.
+
+    A token id that is not in the filter is definitely not revoked, so the usual case costs
+    no database access; only filter hits are confirmed against the table.
+    """
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY, error_rate: float = REVOCATION_BLOOM_ERROR_RATE,
+                 reload_seconds: float = REVOCATION_RELOAD_SECONDS):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.reload_seconds = reload_seconds
+        self._bloom = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _reload(self, db: AsyncSession):
+        # Read-only: this runs inside request authentication, so expired rows are left to `purge_expired`.
+        jtis = (await db.scalars(select(RevokedToken.jti).where(RevokedToken.expires_at > datetime.utcnow()))).all()
+        bloom = BloomFilter(max(self.capacity, len(jtis) * 2), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._loaded_at = time.monotonic()
+
+    async def _filter(self, db: AsyncSession) -> BloomFilter:
+        async with self._lock:
+            if self._bloom is None or time.monotonic() - self._loaded_at > self.reload_seconds:
+                await self._reload(db)
+            return self._bloom
+
+    async def is_revoked(self, db: AsyncSession, jti: str) -> bool:
+        if jti not in await self._filter(db):
+            return False
+        return await db.scalar(select(RevokedToken.jti).where(RevokedToken.jti == jti)) is not None
+
+    async def revoke(self, db: AsyncSession, jti: str, expires_at: datetime):
+        """Revokes an access token id until its expiry."""
+        await db.merge(RevokedToken(jti=jti, expires_at=expires_at))
+        await db.commit()
+
+        bloom = await self._filter(db)
+        bloom.add(jti)
+        if bloom.count > bloom.capacity:
+            self._bloom = None
+
+    async def purge_expired(self):
+        """Deletes revocations of tokens that have expired anyway, in a session of its own."""
+        async with SessionLocal() as db:
+            await db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+            await db.commit()
+
+
+revocation_list = RevocationList()
+
+
+async def run_purger():
+    """Purges expired revocations now and every REVOCATION_PURGE_INTERVAL_SECONDS until cancelled."""
+    while True:
+        try:
+            await revocation_list.purge_expired()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Purging expired token revocations failed")
+        await asyncio.sleep(REVOCATION_PURGE_INTERVAL_SECONDS)
@@ -1,21 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Body, File, UploadFile
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Body, File, UploadFile, Query, Request, Response
+from sqlalchemy import func, select, update, delete
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
-from schemas import UserCreate, LoginRequest, TokenResponse, ProfileUpdate,WeatherResponse, Coordinates, PostCreate, CommentCreate, CropCreate, CropResponse, CropTaskResponse, AgriculturalEventResponse, CommodityRequest, CommodityPriceResponse
-from models import Post, Comment, ServiceProvider, ServiceRequest,Crop, CropTask, AgriculturalEvent
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from schemas import UserCreate, LoginRequest, TokenResponse, RefreshRequest, LogoutRequest, ProfileUpdate, Coordinates, PostCreate, CommentCreate, CropCreate, CropResponse, CropTaskResponse, AgriculturalEventResponse, CommodityRequest, CommodityPriceResponse, BatchPredictionResponse, CommodityBatchRequest, CommodityBatchResponse, CommodityHistoryResponse, PostResponse, CommentResponse, ThreadResponse, SearchResponse, FeedResponse, ServiceProviderResponse, NearbyServiceProvider, ServiceProviderListResponse, NearbyServicesResponse, ServiceRequestListResponse, MonthlyCropTasksResponse, CropImportResponse
+from models import Post, Comment, ServiceProvider, ServiceRequest,Crop, CropTask
 from auth import (
     authenticate_user, create_access_token, get_current_user,
-    create_user, get_user_by_username, hash_password
+    create_user, get_user_by_username, hash_password_async, token_claims, invalidate_user, check_login_rate,
+    issue_refresh_token, rotate_refresh_token, revoke_refresh_token, revoke_user_refresh_tokens, revoke_access_token,
+    oauth2_scheme
 )
-from disease_detection import predict_disease
-from database import get_db
-from datetime import timedelta
+from disease_detection import disease_scheduler, model_status, model_identity, prediction_cache, preprocess_pool, preprocess_image, predict_top_k, read_batch_uploads
+from image_pipeline import read_upload, decode_image_async, ImageTooLarge
+from weather import get_forecast, stream_forecasts, forecast_payload, weather_cache, WeatherUnavailable, WEATHER_BULK_MAX_LOCATIONS
+from agronomy import compute_indicators
+from weather_formats import negotiate, parse_fields, ENCODERS, JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE, msgpack
+from commodities import get_quotes, latest_tick, tick_history, CommodityUnavailable, COMMODITY_BATCH_MAX_SYMBOLS, COMMODITY_SOURCE
+from database import get_db, end_read_transaction
+from search import search, SearchUnavailable, SEARCH_SOURCES, SEARCH_MAX_OFFSET
+from crop_import import import_crops, IMPORT_MEDIA_TYPES
+from crop_calendar import crop_task_index, parse_month, month_name
+from calendar_cache import calendar_cache, etag_matches
+from geo import nearby, NEARBY_MAX_RADIUS_KM
+from pagination import paginate, project, stored_timestamp, PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
+from datetime import timedelta, datetime
 from models import User
-import requests
+import httpx
 from datetime import date
-import http.client
+from typing import Optional
 import json
-import http.client
+import asyncio
+import zipfile
 
 router = APIRouter()
 
@@ -25,12 +43,14 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 #login auth routes
 @router.post("/register",tags=["UserLoginAuth"])
-async def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = get_user_by_username(db, user.username)
+async def register(user: UserCreate, request: Request, db: AsyncSession = Depends(get_db)):
+    check_login_rate(request.client.host if request.client else "unknown")
+
+    existing_user = await get_user_by_username(db, user.username)
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
 
-    create_user(db, user.username, user.email, user.full_name, user.password, user.is_admin)
+    await create_user(db, user.username, user.email, user.full_name, user.password, user.is_admin)
 
     return {
         "message": f"User {user.username} successfully registered as {'admin' if user.is_admin else 'regular user'}"}
@@ -38,18 +58,46 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
 
 @router.post("/login", response_model=TokenResponse, tags=["UserLoginAuth"])
 async def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    check_login_rate(request.client.host if request.client else "unknown")
+
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
 
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
+    )
+    refresh_token = await issue_refresh_token(db, user)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@router.post("/token/refresh", response_model=TokenResponse, tags=["UserLoginAuth"])
+async def refresh_access_token(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """Exchanges a refresh token for a new access token and a rotated refresh token."""
+    user, refresh_token = await rotate_refresh_token(db, body.refresh_token)
+    access_token = create_access_token(
+        data=token_claims(user), expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@router.post("/logout", tags=["UserLoginAuth"])
+async def logout(
+        body: LogoutRequest = Body(LogoutRequest()),
+        token: str = Depends(oauth2_scheme),
+        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """Revokes the current access token and, if given, the refresh token."""
+    await revoke_access_token(db, token)
+    if body.refresh_token:
+        await revoke_refresh_token(db, body.refresh_token)
+    return {"message": "Logged out successfully"}
 
 @router.get("/profile",tags=["ProfileDetails"])
 async def view_profile(current_user: User = Depends(get_current_user)):
@@ -65,15 +113,17 @@ async def view_profile(current_user: User = Depends(get_current_user)):
 async def update_profile(
         updates: ProfileUpdate,
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
-    user = db.query(User).filter(User.id == current_user.id).first()
+    # Hashed before the transaction starts, so no connection is held for the bcrypt rounds.
+    hashed_password = await hash_password_async(updates.password) if updates.password else None
+    user = await db.get(User, current_user.id)
 
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     if updates.username:
-        if db.query(User).filter(User.username == updates.username).first():
+        if await db.scalar(select(User.id).where(User.username == updates.username)):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already taken")
         user.username = updates.username
 
@@ -81,15 +131,18 @@ async def update_profile(
         user.full_name = updates.full_name
 
     if updates.email:
-        if db.query(User).filter(User.email == updates.email).first():
+        if await db.scalar(select(User.id).where(User.email == updates.email)):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already in use")
         user.email = updates.email
 
-    if updates.password:
-        user.hashed_password = hash_password(updates.password)
+    if hashed_password:
+        user.hashed_password = hashed_password
+        user.token_version = (user.token_version or 0) + 1
+        await revoke_user_refresh_tokens(db, user.id)
 
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    invalidate_user(user.id)
 
     return {
         "message": "Profile updated successfully",
@@ -103,69 +156,165 @@ async def update_profile(
 
 
 @router.delete("/users/{user_id}",tags=["UserManagement"],status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user(user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_user(user_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     if not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
 
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
 
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
 
-    db.delete(user)
-    db.commit()
+    # The user's comments on other people's posts go with them; those posts need recounting.
+    commented = (await db.scalars(select(Comment.post_id).where(Comment.user_id == user_id).distinct())).all()
+    await db.delete(user)
+    await db.flush()
+    await _refresh_post_activity(db, commented)
+    await db.commit()
+    invalidate_user(user_id)
 
     return {"message": "User deleted successfully"}
 
 
 # Open weather api
-@router.post("/weather", response_model=WeatherResponse,tags=["OpenWeatherAPI"])
-async def get_weather(coords: Coordinates = Body(...)):
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": coords.lat,
-        "longitude": coords.lon,
-        "hourly": "temperature_2m,relative_humidity_2m,precipitation,weather_code,evapotranspiration,wind_speed_10m,wind_direction_10m,soil_temperature_6cm,soil_moisture_0_to_1cm",
-        "timezone": "auto"
-    }
+# The body is encoded by hand and its shape follows `fields`, `start_hour` and `end_hour`,
+# so the media types are documented here instead of through a response model.
+WEATHER_RESPONSES = {
+    200: {
+        "description": "Hourly series for the selected fields and hours, encoded as negotiated from Accept.",
+        "content": {
+            JSON_MEDIA_TYPE: {"schema": {
+                "type": "object",
+                "description": "`latitude`, `longitude` and one list per selected hourly field",
+            }},
+            MSGPACK_MEDIA_TYPE: {"schema": {
+                "type": "string", "format": "binary",
+                "description": "Header map with one little-endian float32 blob per field",
+            }},
+            COLUMNAR_MEDIA_TYPE: {"schema": {
+                "type": "string", "format": "binary",
+                "description": "uint32 header length, JSON header, then the float32 columns",
+            }},
+        },
+    },
+}
 
-    response = requests.get(url, params=params)
-
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail=f"Failed to retrieve weather data: {response.text}")
-
-    data = response.json()
-
-    return WeatherResponse(
-        latitude=data["latitude"],
-        longitude=data["longitude"],
-        temperature_2m=data["hourly"]["temperature_2m"],
-        relative_humidity_2m=data["hourly"]["relative_humidity_2m"],
-        precipitation=data["hourly"]["precipitation"],
-        weather_code=data["hourly"]["weather_code"],
-        evapotranspiration=data["hourly"]["evapotranspiration"],
-        wind_speed_10m=data["hourly"]["wind_speed_10m"],
-        wind_direction_10m=data["hourly"]["wind_direction_10m"],
-        soil_temperature_6cm=data["hourly"]["soil_temperature_6cm"],
-        soil_moisture_0_to_1cm=data["hourly"]["soil_moisture_0_to_1cm"],
-    )
+
+@router.post("/weather", response_class=Response, responses=WEATHER_RESPONSES, tags=["OpenWeatherAPI"])
+async def get_weather(
+        request: Request,
+        coords: Coordinates = Body(...),
+        fields: Optional[str] = Query(None, description="Comma-separated hourly fields to return (default: all)"),
+        start_hour: int = Query(0, ge=0),
+        end_hour: Optional[int] = Query(None, ge=0),
+):
+    """Hourly weather for a point.
+
+    Send `Accept: application/x-msgpack` or `Accept: application/vnd.agrical.columnar`
+    for a compact float32 encoding instead of JSON.
+    """
+    try:
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    media_type = negotiate(request.headers.get("accept"))
+    if media_type == MSGPACK_MEDIA_TYPE and msgpack is None:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="MessagePack encoding is not available")
+
+    try:
+        forecast = await get_forecast(coords.lat, coords.lon)
+    except WeatherUnavailable as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve weather data: {e}")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Weather service unreachable: {e}")
+
+    body = ENCODERS[media_type](forecast, selected, start_hour, end_hour)
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
+
+
+@router.post("/weather/bulk",tags=["OpenWeatherAPI"])
+async def get_weather_bulk(locations: list[Coordinates] = Body(...)):
+    """Weather for many locations, streamed back as NDJSON lines in completion order."""
+    if len(locations) > WEATHER_BULK_MAX_LOCATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {WEATHER_BULK_MAX_LOCATIONS} locations can be requested at once",
+        )
+
+    async def lines():
+        async for index, forecast, error in stream_forecasts([(c.lat, c.lon) for c in locations]):
+            item = {"index": index, "lat": locations[index].lat, "lon": locations[index].lon}
+            if error is not None:
+                item["error"] = str(error)
+            else:
+                item["weather"] = forecast_payload(forecast)
+            yield json.dumps(item) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/weather/indicators",tags=["OpenWeatherAPI"])
+async def get_weather_indicators(
+        locations: list[Coordinates] = Body(...),
+        base_temperature: float = Query(10.0, description="Base temperature (°C) for growing degree days"),
+        frost_threshold: float = Query(0.0, description="Temperature (°C) at or below which an hour counts as frost"),
+        rolling_days: int = Query(3, ge=1, le=14),
+):
+    """Daily growing degree days, precipitation, evapotranspiration balance and frost windows for one or many locations."""
+    if len(locations) > WEATHER_BULK_MAX_LOCATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {WEATHER_BULK_MAX_LOCATIONS} locations can be requested at once",
+        )
+
+    results = [None] * len(locations)
+    async for index, forecast, error in stream_forecasts([(c.lat, c.lon) for c in locations]):
+        item = {"lat": locations[index].lat, "lon": locations[index].lon}
+        if error is not None:
+            item["error"] = str(error)
+        else:
+            item.update(compute_indicators(forecast, base_temperature, frost_threshold, rolling_days))
+        results[index] = item
+
+    return {"locations": results}
+
+
+@router.get("/weather/stats",tags=["OpenWeatherAPI"])
+async def weather_stats():
+    """Weather cache occupancy and hit counters."""
+    return weather_cache.stats()
 
 
 #Posts comments routes
+async def _refresh_post_activity(db: AsyncSession, post_ids):
+    """Recounts comments and recomputes the latest activity of `post_ids` after comments were removed."""
+    if not post_ids:
+        return
+    count = select(func.count(Comment.id)).where(Comment.post_id == Post.id).scalar_subquery()
+    latest = select(func.max(Comment.created_at)).where(Comment.post_id == Post.id).scalar_subquery()
+    await db.execute(
+        update(Post)
+        .where(Post.id.in_(post_ids))
+        .values(comment_count=count, last_activity_at=func.coalesce(latest, Post.created_at))
+        .execution_options(synchronize_session=False)
+    )
+
+
 @router.post("/posts",tags=["Forum"])
-async def create_post(post: PostCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_post(post: PostCreate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     new_post = Post(title=post.title, content=post.content, user_id=current_user.id)
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.commit()
+    await db.refresh(new_post)
 
     return {"message": "Post created successfully", "post": new_post}
 
 
 
 @router.delete("/posts/{post_id}",tags=["Forum"])
-async def delete_post(post_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    post = db.query(Post).filter(Post.id == post_id).first()
+async def delete_post(post_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    post = await db.get(Post, post_id)
 
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
@@ -173,8 +322,10 @@ async def delete_post(post_id: int, current_user: User = Depends(get_current_use
     if post.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
 
-    db.delete(post)
-    db.commit()
+    # One statement for the comments instead of loading each of them for the cascade.
+    await db.execute(delete(Comment).where(Comment.post_id == post_id).execution_options(synchronize_session=False))
+    await db.delete(post)
+    await db.commit()
 
     return {"message": "Post deleted successfully"}
 
@@ -182,16 +333,19 @@ async def delete_post(post_id: int, current_user: User = Depends(get_current_use
 
 @router.post("/comments",tags=["Forum"])
 async def add_comment(comment: CommentCreate, current_user: User = Depends(get_current_user),
-                      db: Session = Depends(get_db)):
-    post = db.query(Post).filter(Post.id == comment.post_id).first()
+                      db: AsyncSession = Depends(get_db)):
+    post = await db.get(Post, comment.post_id)
 
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
 
     new_comment = Comment(content=comment.content, post_id=comment.post_id, user_id=current_user.id)
     db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    # Incremented in SQL so concurrent comments don't overwrite each other's count.
+    post.comment_count = Post.comment_count + 1
+    post.last_activity_at = func.now()
+    await db.commit()
+    await db.refresh(new_comment)
 
     return {"message": "Comment added successfully", "comment": new_comment}
 
@@ -199,8 +353,8 @@ async def add_comment(comment: CommentCreate, current_user: User = Depends(get_c
 
 @router.delete("/comments/{comment_id}",tags=["Forum"])
 async def delete_comment(comment_id: int, current_user: User = Depends(get_current_user),
-                         db: Session = Depends(get_db)):
-    comment = db.query(Comment).filter(Comment.id == comment_id).first()
+                         db: AsyncSession = Depends(get_db)):
+    comment = await db.get(Comment, comment_id)
 
     if not comment:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
@@ -208,24 +362,135 @@ async def delete_comment(comment_id: int, current_user: User = Depends(get_curre
     if comment.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
 
-    db.delete(comment)
-    db.commit()
+    await db.delete(comment)
+    await db.flush()
+    await _refresh_post_activity(db, [comment.post_id])
+    await db.commit()
 
     return {"message": "Comment deleted successfully"}
 
 
 
+POST_FIELDS = ("id", "title", "content", "created_at", "user_id", "comment_count", "last_activity_at")
+COMMENT_FIELDS = ("id", "content", "created_at", "post_id", "user_id")
+
+
+async def _filter_listing(query, model, db: AsyncSession, author: Optional[str], author_id: Optional[int],
+                    since: Optional[datetime], until: Optional[datetime]):
+    if author is not None:
+        user = await get_user_by_username(db, author)
+        if user is None or (author_id is not None and author_id != user.id):
+            return None
+        author_id = user.id
+    if author_id is not None:
+        query = query.where(model.user_id == author_id)
+    if since is not None:
+        query = query.where(model.created_at >= stored_timestamp(since))
+    if until is not None:
+        query = query.where(model.created_at < stored_timestamp(until))
+    return query
+
+
 @router.get("/posts",tags=["Forum"])
-async def view_posts(db: Session = Depends(get_db)):
-    posts = db.query(Post).all()
-    return {"posts": posts}
+async def view_posts(
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page"),
+        author: Optional[str] = Query(None, description="Only posts by this username"),
+        author_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return (default: all)"),
+        db: AsyncSession = Depends(get_db),
+):
+    """Newest posts first, one page at a time; pass `next_cursor` back as `cursor` for the next page."""
+    try:
+        query = await _filter_listing(select(*project(Post, fields, POST_FIELDS)), Post, db,
+                                      author, author_id, since, until)
+        if query is None:
+            return {"posts": [], "next_cursor": None}
+        posts, next_cursor = await paginate(db, query, [Post.created_at, Post.id], cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"posts": [post._asdict() for post in posts], "next_cursor": next_cursor}
+
+
+
+@router.get("/feed", response_model=FeedResponse, tags=["Forum"])
+async def view_feed(
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page"),
+        db: AsyncSession = Depends(get_db),
+):
+    """Posts with their comment counts, most recently active first."""
+    query = select(Post.id, Post.title, Post.user_id, Post.created_at, Post.comment_count, Post.last_activity_at)
+    try:
+        posts, next_cursor = await paginate(db, query, [Post.last_activity_at, Post.id], cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"posts": [post._asdict() for post in posts], "next_cursor": next_cursor}
 
 
 
 @router.get("/posts/{post_id}/comments",tags=["Forum"])
-async def view_comments(post_id: int, db: Session = Depends(get_db)):
-    comments = db.query(Comment).filter(Comment.post_id == post_id).all()
-    return {"comments": comments}
+async def view_comments(
+        post_id: int,
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page"),
+        author: Optional[str] = Query(None, description="Only comments by this username"),
+        author_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        fields: Optional[str] = Query(None, description="Comma-separated fields to return (default: all)"),
+        db: AsyncSession = Depends(get_db),
+):
+    """Newest comments on a post first, paginated like `/posts`."""
+    try:
+        query = select(*project(Comment, fields, COMMENT_FIELDS)).where(Comment.post_id == post_id)
+        query = await _filter_listing(query, Comment, db, author, author_id, since, until)
+        if query is None:
+            return {"comments": [], "next_cursor": None}
+        comments, next_cursor = await paginate(db, query, [Comment.created_at, Comment.id], cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"comments": [comment._asdict() for comment in comments], "next_cursor": next_cursor}
+
+
+
+@router.get("/posts/{post_id}/thread", response_model=ThreadResponse, tags=["Forum"])
+async def view_thread(
+        post_id: int,
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page of comments"),
+        db: AsyncSession = Depends(get_db),
+):
+    """A post with its author and a page of its newest comments, in two queries."""
+    post = await db.scalar(
+        select(Post)
+        .options(joinedload(Post.user).load_only(User.id, User.username, User.full_name))
+        .where(Post.id == post_id)
+    )
+
+    if not post:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
+
+    query = (
+        select(Comment)
+        .options(joinedload(Comment.user).load_only(User.id, User.username, User.full_name))
+        .where(Comment.post_id == post_id)
+    )
+    try:
+        comments, next_cursor = await paginate(db, query, [Comment.created_at, Comment.id], cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return ThreadResponse(
+        post=PostResponse.model_validate(post),
+        comments=[CommentResponse.model_validate(comment) for comment in comments],
+        next_cursor=next_cursor,
+    )
 
 
 
@@ -234,9 +499,9 @@ async def update_post(
         post_id: int,
         updates: PostCreate,  # Reusing the `PostCreate` model
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
 ):
-    post = db.query(Post).filter(Post.id == post_id).first()
+    post = await db.get(Post, post_id)
 
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
@@ -246,16 +511,16 @@ async def update_post(
 
     post.title = updates.title
     post.content = updates.content
-    db.commit()
-    db.refresh(post)
+    await db.commit()
+    await db.refresh(post)
 
     return {"message": "Post updated successfully", "post": post}
 
 
 
 @router.get("/posts/{post_id}",tags=["Forum"])
-async def get_post(post_id: int, db: Session = Depends(get_db)):
-    post = db.query(Post).filter(Post.id == post_id).first()
+async def get_post(post_id: int, db: AsyncSession = Depends(get_db)):
+    post = await db.get(Post, post_id)
 
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
@@ -263,32 +528,103 @@ async def get_post(post_id: int, db: Session = Depends(get_db)):
     return {"post": post}
 
 
+# Search
+@router.get("/search", response_model=SearchResponse, tags=["Search"])
+async def search_forum_and_services(
+        q: str = Query(..., min_length=1, max_length=200),
+        kinds: str = Query(",".join(SEARCH_SOURCES), description="Comma-separated kinds to search: post, comment, service"),
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+        db: AsyncSession = Depends(get_db),
+):
+    """Full-text search over posts, comments and service providers, best matches first."""
+    selected = [kind.strip() for kind in kinds.split(",") if kind.strip()]
+    unknown = sorted(set(selected) - set(SEARCH_SOURCES))
+    if unknown or not selected:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown kinds: {', '.join(unknown)}. Choose from: {', '.join(SEARCH_SOURCES)}",
+        )
+
+    try:
+        results, next_offset = await search(db, q, selected, limit, offset)
+    except SearchUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"query": q, "results": results, "next_offset": next_offset}
+
+
 # Service routes
 @router.post("/services",tags=["Services"])
 async def add_service(
         name: str,
         description: str,
         contact_info: str,
+        category: Optional[str] = None,
+        latitude: Optional[float] = Query(None, ge=-90, le=90),
+        longitude: Optional[float] = Query(None, ge=-180, le=180),
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(status_code=400, detail="Provide both latitude and longitude, or neither")
+
     new_service = ServiceProvider(
         name=name,
         description=description,
         contact_info=contact_info,
+        category=category,
+        latitude=latitude,
+        longitude=longitude,
         user_id=current_user.id
     )
     db.add(new_service)
-    db.commit()
-    db.refresh(new_service)
+    await db.commit()
+    await db.refresh(new_service)
 
     return {"message": "Service added successfully", "service": new_service}
 
 
-@router.get("/services",tags=["Services"])
-async def view_services(db: Session = Depends(get_db)):
-    services = db.query(ServiceProvider).all()
-    return {"services": services}
+@router.get("/services", response_model=ServiceProviderListResponse, tags=["Services"])
+async def view_services(
+        category: Optional[str] = None,
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page"),
+        db: AsyncSession = Depends(get_db),
+):
+    """Newest service providers first, optionally in one category, one page at a time."""
+    query = select(ServiceProvider)
+    if category is not None:
+        query = query.where(ServiceProvider.category == category)
+    try:
+        services, next_cursor = await paginate(db, query, [ServiceProvider.created_at, ServiceProvider.id], cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"services": services, "next_cursor": next_cursor}
+
+
+@router.get("/services/nearby", response_model=NearbyServicesResponse, tags=["Services"])
+async def view_nearby_services(
+        lat: float = Query(..., ge=-90, le=90),
+        lon: float = Query(..., ge=-180, le=180),
+        k: int = Query(10, ge=1, le=PAGE_MAX_LIMIT),
+        radius_km: float = Query(NEARBY_MAX_RADIUS_KM, gt=0, le=NEARBY_MAX_RADIUS_KM),
+        category: Optional[str] = None,
+        db: AsyncSession = Depends(get_db),
+):
+    """The `k` service providers closest to a point, nearest first."""
+    found = await nearby(db, lat, lon, k, radius_km, category)
+    return {
+        "services": [
+            NearbyServiceProvider(
+                **ServiceProviderResponse.model_validate(provider).model_dump(), distance_km=round(distance, 3)
+            )
+            for provider, distance in found
+        ]
+    }
 
 
 
@@ -296,9 +632,9 @@ async def view_services(db: Session = Depends(get_db)):
 async def delete_service(
         service_id: int,
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
-    service = db.query(ServiceProvider).filter(ServiceProvider.id == service_id).first()
+    service = await db.get(ServiceProvider, service_id)
 
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
@@ -306,8 +642,8 @@ async def delete_service(
     if service.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Permission denied")
 
-    db.delete(service)
-    db.commit()
+    await db.delete(service)
+    await db.commit()
 
     return {"message": "Service deleted successfully"}
 
@@ -318,9 +654,9 @@ async def request_service(
         service_id: int,
         description: str,
         current_user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
 ):
-    service = db.query(ServiceProvider).filter(ServiceProvider.id == service_id).first()
+    service = await db.get(ServiceProvider, service_id)
 
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
@@ -331,75 +667,214 @@ async def request_service(
         user_id=current_user.id
     )
     db.add(new_request)
-    db.commit()
-    db.refresh(new_request)
+    await db.commit()
+    await db.refresh(new_request)
 
     return {"message": "Service requested successfully", "request": new_request}
 
 
 
-@router.get("/services/{service_id}/requests",tags=["Services"])
+@router.get("/services/{service_id}/requests", response_model=ServiceRequestListResponse, tags=["Services"])
 async def view_requests(
         service_id: int,
-        db: Session = Depends(get_db)
+        limit: int = Query(PAGE_DEFAULT_LIMIT, ge=1, le=PAGE_MAX_LIMIT),
+        cursor: Optional[str] = Query(None, description="`next_cursor` from the previous page"),
+        db: AsyncSession = Depends(get_db)
 ):
-    requests = db.query(ServiceRequest).filter(ServiceRequest.service_provider_id == service_id).all()
-    return {"requests": requests}
+    query = select(ServiceRequest).where(ServiceRequest.service_provider_id == service_id)
+    try:
+        requests, next_cursor = await paginate(db, query, [ServiceRequest.created_at, ServiceRequest.id], cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"requests": requests, "next_cursor": next_cursor}
 
 
 # ML prediction model route
 @router.post("/predict-disease",tags=["PredictionModel"])
 async def predict_disease_endpoint(file: UploadFile = File(...)):
-    result = predict_disease(file.file)
-    return result
+    try:
+        data = await read_upload(file)
+        # Hashing and the SQLite cache tier block, so they run off the event loop.
+        cache_key = await run_in_threadpool(prediction_cache.key, data, f"{model_identity()}:label")
+        cached = await run_in_threadpool(prediction_cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+        image = await decode_image_async(data)
+        result = await disease_scheduler.submit(image)
+        await run_in_threadpool(prediction_cache.set, cache_key, result)
+        return result
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@router.post("/predict-disease/batch", response_model=BatchPredictionResponse, tags=["PredictionModel"])
+async def predict_disease_batch_endpoint(
+        files: list[UploadFile] = File(...),
+        top_k: int = Query(3, ge=1, le=10),
+):
+    """Predict many leaf images (or zip archives of images) in one request, with top-k scores per image."""
+    try:
+        images = await run_in_threadpool(read_batch_uploads, files)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    namespace = f"{model_identity()}:top{top_k}"
+    cache_keys = await run_in_threadpool(lambda: [prediction_cache.key(data, namespace) for _, data in images])
+    predictions = await run_in_threadpool(lambda: [prediction_cache.get(key) for key in cache_keys])
+    misses = [index for index, cached in enumerate(predictions) if cached is None]
+
+    loop = asyncio.get_running_loop()
+    tensors = await asyncio.gather(
+        *(loop.run_in_executor(preprocess_pool, preprocess_image, images[index][1]) for index in misses),
+        return_exceptions=True,
+    )
+
+    decoded = [(index, tensor) for index, tensor in zip(misses, tensors) if not isinstance(tensor, Exception)]
+    if decoded:
+        top_k_results = await disease_scheduler.run(predict_top_k, [tensor for _, tensor in decoded], top_k)
+        fresh = {}
+        for (index, _), result in zip(decoded, top_k_results):
+            predictions[index] = result
+            fresh[cache_keys[index]] = result
+        await run_in_threadpool(lambda: [prediction_cache.set(key, result) for key, result in fresh.items()])
+
+    errors = {index: str(tensor) for index, tensor in zip(misses, tensors) if isinstance(tensor, Exception)}
+    results = []
+    for index, (filename, _) in enumerate(images):
+        if index in errors:
+            results.append({"filename": filename, "error": errors[index]})
+        else:
+            results.append({"filename": filename, "predictions": predictions[index]})
+
+    return {"count": len(results), "results": results}
+
+
+@router.get("/predict-disease/stats",tags=["PredictionModel"])
+async def predict_disease_stats():
+    """Inference queue depth, batch-size histogram and model readiness."""
+    return {**disease_scheduler.stats(), "model": model_status(), "cache": prediction_cache.stats()}
+
+
+@router.get("/predict-disease/ready",tags=["PredictionModel"])
+async def predict_disease_ready():
+    """Readiness probe: 503 until the disease model has been loaded."""
+    model = model_status()
+    if not model["ready"]:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=model)
+    return model
 
 
 # Crops routes
 @router.get("/crops", response_model=list[CropResponse],tags=["Crops"])
-async def get_crops(db: Session = Depends(get_db)):
+async def get_crops(db: AsyncSession = Depends(get_db)):
     """Fetch all crops."""
-    crops = db.query(Crop).all()
+    crops = (await db.scalars(select(Crop))).all()
     return [CropResponse.model_validate(crop) for crop in crops]
 
 
-@router.get("/crops/{crop_id}/tasks", response_model=list[CropTaskResponse],tags=["Crops"])
-async def get_crop_tasks(crop_id: int, db: Session = Depends(get_db)):
-    """Fetch tasks for a specific crop."""
-    crop = db.query(Crop).filter(Crop.id == crop_id).first()
+@router.get("/crops/tasks", response_model=MonthlyCropTasksResponse, tags=["Crops"])
+async def get_monthly_crop_tasks(
+        month: Optional[str] = Query(None, description="Month name or number (default: the current month)"),
+        crops: Optional[str] = Query(None, description="Comma-separated crop ids or names (default: every crop with tasks)"),
+        db: AsyncSession = Depends(get_db),
+):
+    """Fetch the tasks due in one month for several crops at once."""
+    try:
+        month_number = parse_month(month) if month else date.today().month
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    if not crop:
+    crop_ids, missing = None, []
+    if crops:
+        crop_ids, missing = await crop_task_index.resolve(db, [crop.strip() for crop in crops.split(",") if crop.strip()])
+
+    return {
+        "month": month_name(month_number),
+        "month_number": month_number,
+        "crops": await crop_task_index.month(db, month_number, crop_ids),
+        "missing": missing,
+    }
+
+
+@router.get("/crops/{crop_id}/tasks", response_model=list[CropTaskResponse],tags=["Crops"])
+async def get_crop_tasks(crop_id: int, db: AsyncSession = Depends(get_db)):
+    """Fetch tasks for a specific crop, in month order; tasks without a recognized month come last."""
+    tasks = (await db.scalars(
+        select(CropTask)
+        .where(CropTask.crop_id == crop_id)
+        .order_by(CropTask.month_number.is_(None), CropTask.month_number, CropTask.id)
+    )).all()
+
+    if not tasks and await db.get(Crop, crop_id) is None:
         raise HTTPException(status_code=404, detail="Crop not found")
 
-    return [CropTaskResponse.model_validate(task) for task in crop.tasks]
+    return [CropTaskResponse.model_validate(task) for task in tasks]
 
 
 @router.post("/crops", response_model=CropResponse,tags=["Crops"])
-async def create_crop(crop: CropCreate, db: Session = Depends(get_db)):
-    existing_crop = db.query(Crop).filter(Crop.name == crop.name).first()
+async def create_crop(crop: CropCreate, db: AsyncSession = Depends(get_db)):
+    existing_crop = await db.scalar(select(Crop.id).where(Crop.name == crop.name))
 
     if existing_crop:
         raise HTTPException(status_code=400, detail=f"Crop with name '{crop.name}' already exists.")
 
+    try:
+        month_numbers = [parse_month(task.month) for task in crop.tasks]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     new_crop = Crop(name=crop.name, description=crop.description)
+    new_crop.tasks = [
+        CropTask(month=month_name(month_number), month_number=month_number, task=task.task)
+        for task, month_number in zip(crop.tasks, month_numbers)
+    ]
     db.add(new_crop)
-    db.commit()
-    db.refresh(new_crop)
+    await db.commit()
+    crop_task_index.invalidate()
 
-    for task in crop.tasks:
-        new_task = CropTask(month=task.month, task=task.task, crop_id=new_crop.id)
-        db.add(new_task)
+    return CropResponse.model_validate(new_crop)
 
-    db.commit()
 
-    return CropResponse.model_validate(new_crop)
 
+@router.post("/crops/bulk", response_model=CropImportResponse, tags=["Crops"])
+async def import_crops_bulk(
+    request: Request,
+    replace_tasks: bool = Query(False, description="Replace the existing tasks of imported crops instead of adding to them"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create or update many crops and their tasks at once.
+
+    The body is a JSON array of crops, NDJSON with one crop per line, or CSV with
+    `name`, `description`, `month` and `task` columns and one row per task. Crops are
+    matched by name. Invalid rows are skipped and reported with their row number.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can import crops.")
+
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if media_type not in IMPORT_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be one of: {', '.join(IMPORT_MEDIA_TYPES)}",
+        )
+
+    report = await import_crops(db, media_type, request.stream(), replace_tasks)
+    crop_task_index.invalidate()
+    return report.as_dict()
 
 
 @router.delete("/crops/{crop_id}/tasks", status_code=204, tags=["Crops"])
 async def delete_crop_tasks(
     crop_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if not current_user.is_admin:
         raise HTTPException(
@@ -407,84 +882,147 @@ async def delete_crop_tasks(
             detail="Only admins can delete crop tasks."
         )
 
-    crop = db.query(Crop).filter(Crop.id == crop_id).first()
+    crop = await db.get(Crop, crop_id)
 
     if not crop:
         raise HTTPException(status_code=404, detail="Crop not found")
 
-    db.query(CropTask).filter(CropTask.crop_id == crop_id).delete()
-    db.commit()
+    await db.execute(delete(CropTask).where(CropTask.crop_id == crop_id))
+    await db.commit()
+    crop_task_index.invalidate()
 
     return {"message": f"All tasks for crop ID {crop_id} have been deleted successfully"}
 
 # Agricultural calendar
+CALENDAR_CACHE_CONTROL = "public, max-age=60"
+
+
+def _calendar_response(request: Request, snapshot, events=None, headers=None) -> Response:
+    """Serves calendar events with the snapshot's ETag, or a 304 when the client already has them."""
+    headers = {"ETag": snapshot.etag, "Cache-Control": CALENDAR_CACHE_CONTROL, **(headers or {})}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    body = snapshot.body if events is None else json.dumps(events, ensure_ascii=False, separators=(",", ":")).encode()
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/agriculture/calendar", response_model=list[AgriculturalEventResponse], tags=["Agricultural Calendar"])
-async def get_agricultural_calendar(db: Session = Depends(get_db)):
-    """Fetch all agricultural events along with recommended farming tasks."""
-    events = db.query(AgriculturalEvent).all()
-    return events
+async def get_agricultural_calendar(
+        request: Request,
+        start: Optional[date] = Query(None, description="Earliest event date (inclusive)"),
+        end: Optional[date] = Query(None, description="Latest event date (inclusive)"),
+        season: Optional[str] = None,
+        category: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1, le=PAGE_MAX_LIMIT),
+        offset: int = Query(0, ge=0),
+        db: AsyncSession = Depends(get_db),
+):
+    """Fetch agricultural events along with recommended farming tasks, by date.
+
+    Filters combine; the total number of matches is returned in `X-Total-Count`.
+    """
+    if start and end and start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must not be after end")
+
+    events, snapshot = await calendar_cache.query(db, start, end, season, category)
+    page = events[offset:offset + limit if limit else None]
+    headers = {"X-Total-Count": str(len(events))}
+    if len(page) == len(snapshot.events):
+        return _calendar_response(request, snapshot, headers=headers)
+    return _calendar_response(request, snapshot, page, headers)
 
 
 @router.get("/agriculture/calendar/season/{season}", response_model=list[AgriculturalEventResponse], tags=["Agricultural Calendar"])
-async def get_events_by_season(season: str, db: Session = Depends(get_db)):
-    events = db.query(AgriculturalEvent).filter(AgriculturalEvent.season == season).all()
+async def get_events_by_season(season: str, request: Request, db: AsyncSession = Depends(get_db)):
+    events, snapshot = await calendar_cache.query(db, season=season)
     if not events:
         raise HTTPException(status_code=404, detail=f"No events found for season '{season}'")
-    return events
+    return _calendar_response(request, snapshot, events)
 
 
 @router.get("/agriculture/calendar/date/{event_date}", response_model=list[AgriculturalEventResponse], tags=["Agricultural Calendar"])
-async def get_events_by_date(event_date: date, db: Session = Depends(get_db)):
-    events = db.query(AgriculturalEvent).filter(AgriculturalEvent.date == event_date).all()
+async def get_events_by_date(event_date: date, request: Request, db: AsyncSession = Depends(get_db)):
+    events, snapshot = await calendar_cache.query(db, start=event_date, end=event_date)
     if not events:
         raise HTTPException(status_code=404, detail=f"No events found for date '{event_date}'")
-    return events
+    return _calendar_response(request, snapshot, events)
 
 
 @router.get("/agriculture/calendar/category/{category}", response_model=list[AgriculturalEventResponse], tags=["Agricultural Calendar"])
-async def get_events_by_category(category: str, db: Session = Depends(get_db)):
-    events = db.query(AgriculturalEvent).filter(AgriculturalEvent.category == category).all()
+async def get_events_by_category(category: str, request: Request, db: AsyncSession = Depends(get_db)):
+    events, snapshot = await calendar_cache.query(db, category=category)
     if not events:
         raise HTTPException(status_code=404, detail=f"No events found for category '{category}'")
-    return events
+    return _calendar_response(request, snapshot, events)
 
 
 
 #Commodities prices route
-COMMODITY_API_KEY = "sk_EBb3274A836943352279a0a8660C540828AaB82839f874cA"
-
 @router.post("/commodity-price", response_model=CommodityPriceResponse, tags=["CommoditiesAPI"])
-async def get_commodity_price(request: CommodityRequest = Body(...)):
-    conn = http.client.HTTPSConnection("commodities.g.apised.com")
-
-    request_path = f"/v1/latest?symbols={request.commodity.upper()}&base_currency={request.currency.upper()}"
-
-    headers = {
-        "x-api-key": COMMODITY_API_KEY
-    }
+async def get_commodity_price(request: CommodityRequest = Body(...), db: AsyncSession = Depends(get_db)):
+    commodity_symbol = request.commodity.upper()
 
-    conn.request("GET", request_path, headers=headers)
-    res = conn.getresponse()
-    data = res.read()
+    tick = await latest_tick(db, commodity_symbol, request.currency.upper())
+    if tick is not None:
+        return CommodityPriceResponse(
+            commodity=tick.symbol,
+            currency=tick.currency,
+            price=tick.price,
+            unit=tick.unit or "Unknown",
+            source=COMMODITY_SOURCE,
+        )
 
+    await end_read_transaction(db)
     try:
-        parsed_data = json.loads(data.decode("utf-8"))
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Invalid response from API")
+        quotes = await get_quotes([commodity_symbol], request.currency)
+    except (CommodityUnavailable, httpx.HTTPError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Commodities API unavailable: {e}")
 
-    print("API Response:", parsed_data)
+    if commodity_symbol not in quotes:
+        raise HTTPException(status_code=404, detail=f"Commodity '{commodity_symbol}' not found in API response.")
 
-    commodity_symbol = request.commodity.upper()
+    return CommodityPriceResponse(**quotes[commodity_symbol])
 
-    if "data" not in parsed_data or "rates" not in parsed_data["data"] or commodity_symbol not in parsed_data["data"]["rates"]:
-        raise HTTPException(status_code=404, detail=f"Commodity '{commodity_symbol}' not found in API response.")
 
-    unit = parsed_data["data"].get("unit", "Unknown")
+@router.post("/commodity-price/batch", response_model=CommodityBatchResponse, tags=["CommoditiesAPI"])
+async def get_commodity_prices(request: CommodityBatchRequest = Body(...)):
+    """Latest prices for many commodities in one upstream call."""
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in request.commodities))
+    if len(symbols) > COMMODITY_BATCH_MAX_SYMBOLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {COMMODITY_BATCH_MAX_SYMBOLS} commodities can be requested at once",
+        )
+
+    try:
+        quotes = await get_quotes(symbols, request.currency)
+    except (CommodityUnavailable, httpx.HTTPError) as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Commodities API unavailable: {e}")
 
-    return CommodityPriceResponse(
-        commodity=commodity_symbol,
+    return CommodityBatchResponse(
         currency=request.currency.upper(),
-        price=parsed_data["data"]["rates"][commodity_symbol],
-        unit=unit,
-        source="APIsed Commodities API"
+        prices=[quotes[symbol] for symbol in symbols if symbol in quotes],
+        missing=[symbol for symbol in symbols if symbol not in quotes],
+    )
+
+
+@router.get("/commodity-price/history", response_model=CommodityHistoryResponse, response_model_exclude_none=True, tags=["CommoditiesAPI"])
+async def get_commodity_price_history(
+        commodity: str,
+        currency: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        bucket_seconds: int = Query(3600, ge=0, description="Downsampling bucket width; 0 returns raw ticks"),
+        limit: int = Query(1000, ge=1, le=10000),
+        db: AsyncSession = Depends(get_db),
+):
+    """Stored price history for a commodity, optionally downsampled to min/max/avg per bucket."""
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=7)
+    points = await tick_history(db, commodity.upper(), currency.upper(), start, end, bucket_seconds, limit)
+    return CommodityHistoryResponse(
+        commodity=commodity.upper(),
+        currency=currency.upper(),
+        bucket_seconds=bucket_seconds,
+        points=points,
     )
\ No newline at end of file
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
-from datetime import date
+from datetime import date, datetime
 
 class UserCreate(BaseModel):
     username: str
@@ -16,6 +16,13 @@ class LoginRequest(BaseModel):
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 
 class ProfileUpdate(BaseModel):
@@ -49,6 +56,101 @@ class CommentCreate(BaseModel):
     content: str
     post_id: int
 
+class AuthorSummary(BaseModel):
+    id: int
+    username: str
+    full_name: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class CommentResponse(BaseModel):
+    id: int
+    content: str
+    created_at: Optional[datetime] = None
+    author: Optional[AuthorSummary] = Field(None, validation_alias="user")
+
+    class Config:
+        from_attributes = True
+
+class PostResponse(BaseModel):
+    id: int
+    title: str
+    content: str
+    created_at: Optional[datetime] = None
+    author: Optional[AuthorSummary] = Field(None, validation_alias="user")
+
+    class Config:
+        from_attributes = True
+
+class ThreadResponse(BaseModel):
+    post: PostResponse
+    comments: List[CommentResponse]
+    next_cursor: Optional[str] = None
+
+class FeedPost(BaseModel):
+    id: int
+    title: str
+    user_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    comment_count: int
+    last_activity_at: Optional[datetime] = None
+
+class FeedResponse(BaseModel):
+    posts: List[FeedPost]
+    next_cursor: Optional[str] = None
+
+class ServiceProviderResponse(BaseModel):
+    id: int
+    name: str
+    description: str
+    contact_info: str
+    category: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    created_at: Optional[datetime] = None
+    user_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class NearbyServiceProvider(ServiceProviderResponse):
+    distance_km: float
+
+class ServiceProviderListResponse(BaseModel):
+    services: List[ServiceProviderResponse]
+    next_cursor: Optional[str] = None
+
+class NearbyServicesResponse(BaseModel):
+    services: List[NearbyServiceProvider]
+
+class ServiceRequestResponse(BaseModel):
+    id: int
+    description: str
+    created_at: Optional[datetime] = None
+    service_provider_id: int
+    user_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class ServiceRequestListResponse(BaseModel):
+    requests: List[ServiceRequestResponse]
+    next_cursor: Optional[str] = None
+
+class SearchResult(BaseModel):
+    kind: str
+    id: int
+    title: Optional[str] = None
+    post_id: Optional[int] = None
+    snippet: str
+    rank: float
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+    next_offset: Optional[int] = None
+
 class CropResponse(BaseModel):
     id: int
     name: str
@@ -65,6 +167,17 @@ class CropTaskResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class CropMonthTasks(BaseModel):
+    crop_id: int
+    crop_name: str
+    tasks: List[CropTaskResponse]
+
+class MonthlyCropTasksResponse(BaseModel):
+    month: str
+    month_number: int
+    crops: List[CropMonthTasks]
+    missing: List[str] = []
+
 class TaskCreate(BaseModel):
     month: str
     task: str
@@ -74,14 +187,25 @@ class CropCreate(BaseModel):
     description: Optional[str] = None
     tasks: List[TaskCreate]
 
+class CropImportError(BaseModel):
+    row: int
+    error: str
+
+class CropImportResponse(BaseModel):
+    rows: int
+    crops_created: int
+    crops_updated: int
+    tasks_inserted: int
+    errors: List[CropImportError]
+
 class AgriculturalEventResponse(BaseModel):
     id: int
     name: str
-    description: str
+    description: Optional[str]
     date: date
-    season: str
-    category: str
-    tasks: str
+    season: Optional[str]
+    category: Optional[str]
+    tasks: Optional[str]
 
     class Config:
         from_attributes = True
@@ -95,4 +219,40 @@ class CommodityPriceResponse(BaseModel):
     currency: str
     price: float
     unit: str
-    source: str
\ No newline at end of file
+    source: str
+
+class CommodityBatchRequest(BaseModel):
+    commodities: List[str]
+    currency: str
+
+class CommodityBatchResponse(BaseModel):
+    currency: str
+    prices: List[CommodityPriceResponse]
+    missing: List[str] = []
+
+class DiseaseScore(BaseModel):
+    label: str
+    score: float
+
+class ImagePrediction(BaseModel):
+    filename: str
+    predictions: List[DiseaseScore] = []
+    error: Optional[str] = None
+
+class BatchPredictionResponse(BaseModel):
+    count: int
+    results: List[ImagePrediction]
+
+class CommodityHistoryPoint(BaseModel):
+    timestamp: datetime
+    price: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    avg: Optional[float] = None
+    count: Optional[int] = None
+
+class CommodityHistoryResponse(BaseModel):
+    commodity: str
+    currency: str
+    bucket_seconds: int
+    points: List[CommodityHistoryPoint]
\ No newline at end of file
@@ -0,0 +1,126 @@
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+import html
+import os
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "1000"))
+SNIPPET_TOKENS = 12
+# FTS5 inserts these around matches in the raw text; they become <b> tags after the text is escaped.
+_MATCH_START, _MATCH_END = "\x02", "\x03"
+
+# External-content FTS5 tables: the text lives only in the source table, the index is kept
+# in sync by triggers. The first column listed is weighted highest by bm25.
+SEARCH_SOURCES = {
+    "post": {"fts": "posts_fts", "table": "posts", "columns": ("title", "content"), "weights": (5.0, 1.0)},
+    "comment": {"fts": "comments_fts", "table": "comments", "columns": ("content",), "weights": (1.0,)},
+    "service": {"fts": "service_providers_fts", "table": "service_providers",
+                "columns": ("name", "description"), "weights": (5.0, 1.0)},
+}
+
+# Title/parent columns returned for each kind, selected from the joined source table `src`.
+_RESULT_COLUMNS = {
+    "post": "src.title, NULL",
+    "comment": "NULL, src.post_id",
+    "service": "src.name, NULL",
+}
+
+search_available = False
+
+
+class SearchUnavailable(Exception):
+    """Raised when SQLite was built without FTS5."""
+
+
+def _trigger_ddl(fts: str, table: str, columns) -> list:
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    delete = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {names} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+def create_search_index(connection):
+    """Creates the FTS5 tables and sync triggers, indexing existing rows the first time."""
+    global search_available
+    if connection.dialect.name != "sqlite":
+        return
+
+    existing = {name for (name,) in connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    try:
+        for source in SEARCH_SOURCES.values():
+            fts, table, columns = source["fts"], source["table"], source["columns"]
+            if fts not in existing:
+                connection.exec_driver_sql(
+                    f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(columns)}, content='{table}', "
+                    f"content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+                )
+                connection.exec_driver_sql(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            for ddl in _trigger_ddl(fts, table, columns):
+                connection.exec_driver_sql(ddl)
+    except OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        logger.warning("SQLite has no FTS5 support; /search is disabled")
+        return
+    search_available = True
+
+
+def match_query(q: str) -> str:
+    """Turns free text into an FTS5 query matching every word, the last one as a prefix.
+
+    Each word is quoted so that FTS5 operators and punctuation in user input are taken literally.
+    """
+    terms = ['"' + term.replace('"', '""') + '"' for term in q.split()]
+    if not terms:
+        raise ValueError("Search query is empty")
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight(snippet: str) -> str:
+    text = html.escape(snippet)
+    return text.replace(_MATCH_START, "<b>").replace(_MATCH_END, "</b>")
+
+
+async def search(db: AsyncSession, q: str, kinds, limit: int, offset: int = 0):
+    """Best-ranked matches across `kinds`, with highlighted snippets.
+
+    Snippets are HTML: the stored text is escaped and matches are wrapped in <b> tags.
+
+    Returns one page of results and the offset of the next page, or None on the last page.
+    """
+    if not search_available:
+        raise SearchUnavailable("Full-text search is not available")
+
+    selects = []
+    for kind in kinds:
+        source = SEARCH_SOURCES[kind]
+        fts = source["fts"]
+        weights = ", ".join(str(weight) for weight in source["weights"])
+        selects.append(
+            f"SELECT '{kind}' AS kind, {fts}.rowid AS id, {_RESULT_COLUMNS[kind]}, "
+            f"snippet({fts}, -1, char(2), char(3), '…', {SNIPPET_TOKENS}) AS snippet, "
+            f"bm25({fts}, {weights}) AS rank "
+            f"FROM {fts} JOIN {source['table']} AS src ON src.id = {fts}.rowid WHERE {fts} MATCH :q"
+        )
+    sql = " UNION ALL ".join(selects) + " ORDER BY rank, kind, id LIMIT :limit OFFSET :offset"
+
+    # `.columns()` marks the statement as a SELECT so the session runs it on a read connection.
+    rows = (await db.execute(text(sql).columns(), {"q": match_query(q), "limit": limit + 1, "offset": offset})).all()
+    results = [
+        {"kind": kind, "id": id, "title": title, "post_id": post_id, "snippet": _highlight(snippet), "rank": rank}
+        for kind, id, title, post_id, snippet, rank in rows[:limit]
+    ]
+    next_offset = offset + limit if len(rows) > limit and offset + limit <= SEARCH_MAX_OFFSET else None
+    return results, next_offset
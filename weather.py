@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from array import array
+from http_client import get_with_retry, SingleFlight
+import asyncio
+import logging
+import httpx
+import math
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+HOURLY_VARIABLES = [
+    "temperature_2m",
+    "relative_humidity_2m",
+    "precipitation",
+    "weather_code",
+    "evapotranspiration",
+    "wind_speed_10m",
+    "wind_direction_10m",
+    "soil_temperature_6cm",
+    "soil_moisture_0_to_1cm",
+]
+
+WEATHER_GRID_DEGREES = float(os.getenv("WEATHER_GRID_DEGREES", "0.05"))
+# Open-Meteo re-runs its forecast models hourly; new data is published a few minutes after the hour.
+WEATHER_REFRESH_MINUTES = float(os.getenv("WEATHER_REFRESH_MINUTES", "60"))
+WEATHER_REFRESH_OFFSET_SECONDS = float(os.getenv("WEATHER_REFRESH_OFFSET_SECONDS", "300"))
+WEATHER_STALE_SECONDS = float(os.getenv("WEATHER_STALE_SECONDS", "1800"))
+WEATHER_CACHE_MAX_CELLS = int(os.getenv("WEATHER_CACHE_MAX_CELLS", "10000"))
+WEATHER_BULK_MAX_LOCATIONS = int(os.getenv("WEATHER_BULK_MAX_LOCATIONS", "500"))
+WEATHER_BULK_CONCURRENCY = int(os.getenv("WEATHER_BULK_CONCURRENCY", "8"))
+
+
+class WeatherUnavailable(Exception):
+    """Raised when Open-Meteo answers with an error status."""
+
+
+class Forecast:
+    """Hourly forecast for one location, kept as packed float columns instead of lists of Python floats.
+
+    Missing upstream values are stored as NaN.
+    """
+
+    __slots__ = ("latitude", "longitude", "timezone", "utc_offset_seconds", "start_time", "hours", "series")
+
+    def __init__(self, latitude, longitude, timezone, utc_offset_seconds, start_time, series):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timezone = timezone
+        self.utc_offset_seconds = utc_offset_seconds
+        self.start_time = start_time
+        self.series = series
+        self.hours = min((len(values) for values in series.values()), default=0)
+
+    @classmethod
+    def from_open_meteo(cls, data: dict) -> "Forecast":
+        hourly = data["hourly"]
+        times = hourly.get("time") or [None]
+        series = {
+            variable: array("d", (math.nan if value is None else value for value in hourly[variable]))
+            for variable in HOURLY_VARIABLES
+        }
+        return cls(
+            data["latitude"],
+            data["longitude"],
+            data.get("timezone"),
+            data.get("utc_offset_seconds", 0),
+            times[0],
+            series,
+        )
+
+
+def grid_cell(lat: float, lon: float) -> tuple:
+    """Snaps a coordinate to its WEATHER_GRID_DEGREES cell."""
+    return round(lat / WEATHER_GRID_DEGREES), round(lon / WEATHER_GRID_DEGREES)
+
+
+def cell_center(cell: tuple) -> tuple:
+    """Coordinate sent upstream for a grid cell."""
+    return round(cell[0] * WEATHER_GRID_DEGREES, 6), round(cell[1] * WEATHER_GRID_DEGREES, 6)
+
+
+def next_refresh(now: float) -> float:
+    """Time at which the upstream forecast run after `now` becomes available."""
+    interval = WEATHER_REFRESH_MINUTES * 60
+    boundary = (now - WEATHER_REFRESH_OFFSET_SECONDS) // interval * interval + WEATHER_REFRESH_OFFSET_SECONDS
+    return boundary + interval
+
+
+class WeatherCache:
+    """Forecasts per grid cell, fresh until the next upstream model run and then served stale for a while."""
+
+    def __init__(self, max_cells: int = WEATHER_CACHE_MAX_CELLS, stale_seconds: float = WEATHER_STALE_SECONDS):
+        self.max_cells = max_cells
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, cell):
+        """Returns (forecast, is_fresh) for a cell, or None when absent or too old to serve."""
+        entry = self._entries.get(cell)
+        now = time.time()
+        if entry is None or now >= entry[1] + self.stale_seconds:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(cell)
+        if now < entry[1]:
+            self.hits += 1
+            return entry[0], True
+        self.stale_hits += 1
+        return entry[0], False
+
+    def set(self, cell, forecast: Forecast):
+        self._entries[cell] = (forecast, next_refresh(time.time()))
+        self._entries.move_to_end(cell)
+        while len(self._entries) > self.max_cells:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "cells": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+
+weather_cache = WeatherCache()
+_forecast_calls = SingleFlight()
+_revalidations = set()
+
+
+async def _fetch_forecast(lat: float, lon: float) -> dict:
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "hourly": ",".join(HOURLY_VARIABLES),
+        "timezone": "auto",
+    }
+    response = await get_with_retry(OPEN_METEO_URL, params=params)
+
+    if response.status_code != 200:
+        raise WeatherUnavailable(response.text)
+
+    return response.json()
+
+
+async def _refresh_cell(cell) -> Forecast:
+    forecast = Forecast.from_open_meteo(await _fetch_forecast(*cell_center(cell)))
+    weather_cache.set(cell, forecast)
+    return forecast
+
+
+def refresh_cell(cell):
+    """Fetches a cell's forecast; concurrent refreshes of the same cell share one upstream call."""
+    return _forecast_calls.do(cell, lambda: _refresh_cell(cell))
+
+
+async def _revalidate(cell):
+    try:
+        await refresh_cell(cell)
+    except Exception:
+        logger.warning("Background weather refresh failed for cell %s", cell, exc_info=True)
+
+
+async def get_forecast(lat: float, lon: float) -> Forecast:
+    """Hourly forecast for the grid cell containing (lat, lon).
+
+    Fresh entries are served from memory. Stale entries are served immediately while a
+    background task revalidates them, and only missing cells wait on the upstream call.
+    """
+    cell = grid_cell(lat, lon)
+    cached = weather_cache.get(cell)
+    if cached is None:
+        return await refresh_cell(cell)
+
+    forecast, fresh = cached
+    if not fresh:
+        task = asyncio.ensure_future(_revalidate(cell))
+        _revalidations.add(task)
+        task.add_done_callback(_revalidations.discard)
+    return forecast
+
+
+def select_series(forecast: Forecast, fields=None, start: int = 0, end=None) -> dict:
+    """Slices the requested hourly columns (all by default) to the hour range [start, end)."""
+    return {variable: forecast.series[variable][start:end] for variable in (fields or HOURLY_VARIABLES)}
+
+
+def forecast_payload(forecast: Forecast, fields=None, start: int = 0, end=None) -> dict:
+    """The fields of WeatherResponse as plain lists, with missing values as None."""
+    payload = {"latitude": forecast.latitude, "longitude": forecast.longitude}
+    for variable, values in select_series(forecast, fields, start, end).items():
+        cast = int if variable == "weather_code" else float
+        payload[variable] = [None if value != value else cast(value) for value in values]
+    return payload
+
+
+async def stream_forecasts(coordinates):
+    """Yields (index, forecast, error) for each (lat, lon) as its grid cell's forecast becomes available.
+
+    Coordinates that fall in the same cell share one lookup, and at most
+    WEATHER_BULK_CONCURRENCY cells are fetched from upstream at a time.
+    """
+    cells = {}
+    for index, (lat, lon) in enumerate(coordinates):
+        cells.setdefault(grid_cell(lat, lon), []).append(index)
+
+    semaphore = asyncio.Semaphore(WEATHER_BULK_CONCURRENCY)
+
+    async def lookup(cell):
+        async with semaphore:
+            try:
+                return cell, await get_forecast(*cell_center(cell)), None
+            except (WeatherUnavailable, httpx.HTTPError) as e:
+                return cell, None, e
+
+    tasks = [asyncio.ensure_future(lookup(cell)) for cell in cells]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            cell, forecast, error = await next_done
+            for index in cells[cell]:
+                yield index, forecast, error
+    finally:
+        for task in tasks:
+            task.cancel()
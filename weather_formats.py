@@ -0,0 +1,85 @@
+from weather import Forecast, select_series, forecast_payload, HOURLY_VARIABLES
+from array import array
+import struct
+import json
+import sys
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+COLUMNAR_MEDIA_TYPE = "application/vnd.agrical.columnar"
+
+
+def parse_fields(fields):
+    """Splits a comma-separated field selection, rejecting unknown hourly variables."""
+    if not fields:
+        return None
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in HOURLY_VARIABLES]
+    if unknown:
+        raise ValueError(f"Unknown weather fields: {', '.join(unknown)}")
+    return selected
+
+
+def negotiate(accept: str):
+    """Picks the response encoding from an Accept header; JSON unless a compact type is asked for."""
+    accept = (accept or "").lower()
+    if COLUMNAR_MEDIA_TYPE in accept or "application/octet-stream" in accept:
+        return COLUMNAR_MEDIA_TYPE
+    if MSGPACK_MEDIA_TYPE in accept or "application/msgpack" in accept:
+        return MSGPACK_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def _float32_bytes(values) -> bytes:
+    packed = array("f", values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _header(forecast: Forecast, columns: dict, start: int) -> dict:
+    return {
+        "latitude": forecast.latitude,
+        "longitude": forecast.longitude,
+        "timezone": forecast.timezone,
+        "utc_offset_seconds": forecast.utc_offset_seconds,
+        "start_time": forecast.start_time,
+        "start_hour": start,
+        "hours": len(next(iter(columns.values()), ())),
+        "fields": list(columns),
+        "dtype": "<f4",
+    }
+
+
+def encode_json(forecast: Forecast, fields=None, start: int = 0, end=None) -> bytes:
+    """WeatherResponse-shaped JSON, restricted to the selected fields and hours."""
+    return json.dumps(forecast_payload(forecast, fields, start, end), separators=(",", ":")).encode()
+
+
+def encode_msgpack(forecast: Forecast, fields=None, start: int = 0, end=None) -> bytes:
+    """MessagePack map of the header fields plus one little-endian float32 blob per column (NaN = missing)."""
+    columns = select_series(forecast, fields, start, end)
+    document = _header(forecast, columns, start)
+    document["columns"] = {variable: _float32_bytes(values) for variable, values in columns.items()}
+    return msgpack.packb(document, use_bin_type=True)
+
+
+def encode_columnar(forecast: Forecast, fields=None, start: int = 0, end=None) -> bytes:
+    """Binary columnar layout: a little-endian uint32 header length, the JSON header,
+    then each column in header order as `hours` little-endian float32 values (NaN = missing)."""
+    columns = select_series(forecast, fields, start, end)
+    header = json.dumps(_header(forecast, columns, start), separators=(",", ":")).encode()
+    return b"".join([struct.pack("<I", len(header)), header, *(_float32_bytes(values) for values in columns.values())])
+
+
+ENCODERS = {
+    JSON_MEDIA_TYPE: encode_json,
+    MSGPACK_MEDIA_TYPE: encode_msgpack,
+    COLUMNAR_MEDIA_TYPE: encode_columnar,
+}